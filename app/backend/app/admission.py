@@ -0,0 +1,210 @@
+"""
+Admission control for SmartLiva API
+
+Requests are grouped into route classes, each with its own concurrency
+limit and bounded wait queue. A worker-wide slot limit is shared between
+classes and freed slots go to the highest-priority waiter first, so
+clinical inference (/predict, report translation) keeps flowing while chat
+traffic is queued or shed during peaks.
+
+Overload is answered immediately instead of slowing everything down:
+- queue full on arrival  -> 429 Too Many Requests
+- queue deadline expired -> 503 Service Unavailable
+both with a Retry-After header estimated from recent service times.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from .shared_state import store
+
+
+@dataclass
+class RouteClass:
+    name: str
+    priority: int  # lower value is served first
+    max_concurrency: int
+    max_queue: int
+    queue_timeout: float  # seconds a request may wait for a slot
+    active: int = 0
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+    avg_service_s: float = 1.0  # EWMA of time spent holding a slot
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def default_route_classes() -> List[RouteClass]:
+    return [
+        RouteClass(
+            name="clinical",
+            priority=0,
+            max_concurrency=_env_int("ADMISSION_CLINICAL_CONCURRENCY", 8),
+            max_queue=_env_int("ADMISSION_CLINICAL_QUEUE", 32),
+            queue_timeout=_env_float("ADMISSION_CLINICAL_TIMEOUT", 10.0),
+        ),
+        RouteClass(
+            name="chat",
+            priority=1,
+            max_concurrency=_env_int("ADMISSION_CHAT_CONCURRENCY", 4),
+            max_queue=_env_int("ADMISSION_CHAT_QUEUE", 16),
+            queue_timeout=_env_float("ADMISSION_CHAT_TIMEOUT", 2.0),
+        ),
+    ]
+
+
+# Route path -> class; anything else (health, languages, metrics, UI strings) bypasses admission
+ROUTE_PREFIXES = [
+    ("/predict", "clinical"),
+    ("/api/translation/translate", "clinical"),
+    ("/chat", "chat"),
+]
+
+
+def classify(path: str) -> Optional[str]:
+    for prefix, class_name in ROUTE_PREFIXES:
+        if path == prefix or path.startswith(prefix + "/"):
+            return class_name
+    return None
+
+
+class AdmissionController:
+    """Per-worker scheduler; all state is touched from the event loop only."""
+
+    def __init__(self, classes: List[RouteClass], total_concurrency: int):
+        self.classes: Dict[str, RouteClass] = {c.name: c for c in classes}
+        self.total_concurrency = total_concurrency
+        self.active_total = 0
+
+    def _has_slot(self, rc: RouteClass) -> bool:
+        return rc.active < rc.max_concurrency and self.active_total < self.total_concurrency
+
+    def _waiting_ahead(self, rc: RouteClass) -> bool:
+        """True if a queued request should be served before a new one of this class."""
+        if rc.waiters:
+            return True
+        # Higher-priority waiters only block us when they are held back by the shared limit
+        return any(
+            c.waiters and c.active < c.max_concurrency
+            for c in self.classes.values() if c.priority < rc.priority
+        )
+
+    def _retry_after(self, rc: RouteClass) -> int:
+        backlog = len(rc.waiters) + rc.active
+        return max(1, math.ceil(rc.avg_service_s * backlog / max(1, rc.max_concurrency)))
+
+    def _grant(self, rc: RouteClass) -> None:
+        rc.active += 1
+        self.active_total += 1
+
+    def _set_depth(self, rc: RouteClass, delta: int) -> None:
+        store.incr(f"admission.{rc.name}.queue_depth", delta)
+
+    async def acquire(self, class_name: str) -> None:
+        rc = self.classes[class_name]
+        if self._has_slot(rc) and not self._waiting_ahead(rc):
+            self._grant(rc)
+            return
+
+        if len(rc.waiters) >= rc.max_queue:
+            store.incr(f"admission.{rc.name}.rejected")
+            raise Overloaded(429, self._retry_after(rc), f"{rc.name} queue is full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        rc.waiters.append(waiter)
+        self._set_depth(rc, 1)
+        enqueued = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=rc.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted just as we gave up; hand it on
+                self.release(class_name, 0.0)
+            else:
+                waiter.cancel()
+                rc.waiters.remove(waiter)
+                self._set_depth(rc, -1)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            store.incr(f"admission.{rc.name}.timed_out")
+            raise Overloaded(503, self._retry_after(rc), f"{rc.name} queue deadline exceeded")
+        store.observe(f"admission.{rc.name}.queue_wait_ms", (time.perf_counter() - enqueued) * 1000)
+
+    def release(self, class_name: str, service_s: float) -> None:
+        rc = self.classes[class_name]
+        rc.active -= 1
+        self.active_total -= 1
+        if service_s > 0:
+            rc.avg_service_s = 0.8 * rc.avg_service_s + 0.2 * service_s
+        self._wake_next()
+
+    def _wake_next(self) -> None:
+        for rc in sorted(self.classes.values(), key=lambda c: c.priority):
+            while rc.waiters and self._has_slot(rc):
+                waiter = rc.waiters.popleft()
+                self._set_depth(rc, -1)
+                self._grant(rc)
+                waiter.set_result(None)
+            if rc.waiters and rc.active < rc.max_concurrency:
+                # Out of shared slots: don't let lower-priority classes overtake this one
+                return
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                "active": rc.active,
+                "queued": len(rc.waiters),
+                "max_concurrency": rc.max_concurrency,
+                "max_queue": rc.max_queue,
+                "avg_service_s": round(rc.avg_service_s, 3),
+            }
+            for name, rc in self.classes.items()
+        }
+
+
+controller = AdmissionController(
+    default_route_classes(),
+    total_concurrency=_env_int("ADMISSION_TOTAL_CONCURRENCY", 10),
+)
+
+
+def install(app) -> None:
+    """Register the admission middleware on a FastAPI app."""
+    from fastapi.responses import JSONResponse
+
+    @app.middleware("http")
+    async def admission_middleware(request, call_next):
+        class_name = classify(request.url.path)
+        if class_name is None:
+            return await call_next(request)
+        try:
+            await controller.acquire(class_name)
+        except Overloaded as e:
+            return JSONResponse(
+                status_code=e.status_code,
+                content={"detail": e.detail},
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        start = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            controller.release(class_name, time.perf_counter() - start)
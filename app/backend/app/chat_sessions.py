@@ -0,0 +1,188 @@
+"""
+Server-side chat sessions for the HepaSage WebSocket channel
+
+The HTTP ``/chat`` endpoint makes clients resend the whole history every
+turn. A session keeps that history on the server together with the ready
+OpenAI message list (system prompt + turns), so a client only sends the new
+message and the prompt is extended in place instead of rebuilt.
+
+Sessions live in a bounded in-memory LRU; idle ones are evicted first.
+Setting ``CHAT_SESSION_DB`` also writes sessions through to SQLite, so a
+client reconnecting to another worker (or after a restart) resumes its
+conversation. With the database configured it is the source of truth: a
+cached copy is only used while no other worker has saved a newer one.
+Stored sessions idle for longer than ``CHAT_SESSION_IDLE_TTL`` are deleted
+every ``CHAT_SESSION_PURGE_INTERVAL`` seconds by a background thread.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import logging
+
+from .shared_state import LocalConnection, store
+
+logger = logging.getLogger(__name__)
+
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", 10000))
+CHAT_SESSION_IDLE_TTL = float(os.getenv("CHAT_SESSION_IDLE_TTL", 2 * 3600))
+# Turns kept in the prompt; older ones are dropped to bound prompt size
+CHAT_SESSION_MAX_MESSAGES = int(os.getenv("CHAT_SESSION_MAX_MESSAGES", 20))
+CHAT_SESSION_DB = os.getenv("CHAT_SESSION_DB")
+CHAT_SESSION_PURGE_INTERVAL = float(os.getenv("CHAT_SESSION_PURGE_INTERVAL", 600))
+
+
+class ChatSession:
+    def __init__(self, session_id: str, system_prompt: str, history: Optional[List[Dict[str, str]]] = None):
+        self.session_id = session_id
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.history: List[Dict[str, str]] = list(history or [])
+        self.last_used = time.time()
+        # updated_at of the stored row this copy reflects (0 if never stored)
+        self.saved_at = 0.0
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        """OpenAI message list: precomputed system prefix followed by the kept turns."""
+        return [self.system_message, *self.history]
+
+    def append(self, role: str, content: str) -> None:
+        self.history.append({"role": role, "content": content})
+        if len(self.history) > CHAT_SESSION_MAX_MESSAGES:
+            # Drop whole exchanges from the front so the history still starts with a user turn
+            excess = len(self.history) - CHAT_SESSION_MAX_MESSAGES
+            excess += excess % 2
+            del self.history[:excess]
+        self.last_used = time.time()
+
+
+def _setup(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS chat_sessions "
+        "(id TEXT PRIMARY KEY, history TEXT NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS chat_sessions_updated ON chat_sessions (updated_at)")
+
+
+class ChatSessionStore:
+    def __init__(self, max_sessions: int = CHAT_SESSION_MAX, idle_ttl: float = CHAT_SESSION_IDLE_TTL,
+                 db_path: Optional[str] = CHAT_SESSION_DB):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.db_path = db_path
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._db = LocalConnection(db_path, _setup, synchronous="FULL") if db_path else None
+        self._purger_pid: Optional[int] = None
+        self._purger_lock = threading.Lock()
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if self._db is None:
+            return None
+        self._ensure_purger()
+        return self._db()
+
+    def _ensure_purger(self) -> None:
+        # One daemon thread per process, started lazily so each forked worker gets its own
+        if self._purger_pid == os.getpid():
+            return
+        with self._purger_lock:
+            if self._purger_pid == os.getpid():
+                return
+            self._purger_pid = os.getpid()
+        threading.Thread(target=self._purge_loop, name="chat-sessions", daemon=True).start()
+
+    def _purge_loop(self) -> None:
+        while True:
+            time.sleep(CHAT_SESSION_PURGE_INTERVAL)
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """Delete stored sessions idle for longer than ``idle_ttl``."""
+        if self._db is None:
+            return 0
+        try:
+            purged = self._db().execute(
+                "DELETE FROM chat_sessions WHERE updated_at < ?", (time.time() - self.idle_ttl,)
+            ).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Chat session purge failed: {e}")
+            return 0
+        if purged:
+            store.incr("chat_sessions.purged", purged)
+        return purged
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.idle_ttl
+        # OrderedDict is kept in LRU order, so idle sessions sit at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.max_sessions and oldest.last_used >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            store.incr("chat_sessions.evicted")
+
+    def _load(self, session_id: str, system_prompt: str) -> Optional[ChatSession]:
+        conn = self._conn()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(
+                "SELECT history, updated_at FROM chat_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Chat session load failed: {e}")
+            return None
+        if row is None or row[1] < time.time() - self.idle_ttl:
+            return None
+        session = ChatSession(session_id, system_prompt, json.loads(row[0]))
+        session.saved_at = row[1]
+        return session
+
+    def get_or_create(self, session_id: Optional[str], system_prompt: str) -> ChatSession:
+        session = self._sessions.get(session_id) if session_id else None
+        if session_id and self.db_path:
+            # Another worker may have extended the session since it was cached here (A -> B -> A)
+            stored = self._load(session_id, system_prompt)
+            if stored is not None and (session is None or stored.saved_at > session.saved_at):
+                session = stored
+        if session is None:
+            session = ChatSession(session_id or uuid.uuid4().hex, system_prompt)
+            store.incr("chat_sessions.created")
+        # The prompt follows this connection's options (e.g. ?target_language), not the previous one's
+        session.system_message = {"role": "system", "content": system_prompt}
+        session.last_used = time.time()
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        self._evict()
+        return session
+
+    def save(self, session: ChatSession) -> None:
+        conn = self._conn()
+        if conn is None:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_sessions (id, history, updated_at) VALUES (?, ?, ?)",
+                (session.session_id, json.dumps(session.history, ensure_ascii=False), session.last_used),
+            )
+            session.saved_at = session.last_used
+        except sqlite3.Error as e:
+            logger.warning(f"Chat session save failed: {e}")
+
+    def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        conn = self._conn()
+        if conn is not None:
+            conn.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# Global chat session store
+chat_sessions = ChatSessionStore()
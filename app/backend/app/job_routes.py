@@ -0,0 +1,65 @@
+"""
+Job status API for SmartLiva background jobs
+"""
+
+import asyncio
+import json
+from typing import Any, Dict
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .jobs import POLL_INTERVAL, TERMINAL_STATUSES, job_queue
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"])
+
+
+def accepted(job: Dict[str, Any]) -> JSONResponse:
+    """202 response for a submitted job, pointing at its status and event stream"""
+    job_id = job["job_id"]
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status": job["status"],
+            "status_url": f"/api/jobs/{job_id}",
+            "events_url": f"/api/jobs/{job_id}/events",
+        },
+        headers={"Location": f"/api/jobs/{job_id}"},
+    )
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """
+    Poll job status, progress and (once finished) result
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@router.get("/{job_id}/events")
+async def stream_job(job_id: str):
+    """
+    Stream job progress as server-sent events until the job finishes
+    """
+    if job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    async def events():
+        last = None
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield "event: error\ndata: {\"detail\": \"Job expired\"}\n\n"
+                return
+            snapshot = (job["status"], job["progress"], job["progress_message"])
+            if snapshot != last:
+                last = snapshot
+                event = "result" if job["status"] in TERMINAL_STATUSES else "progress"
+                yield f"event: {event}\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
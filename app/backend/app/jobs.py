@@ -0,0 +1,296 @@
+"""
+Durable background jobs for long-running SmartLiva work
+
+Large interface translations and multi-image predictions can outlive proxy
+timeouts (Railway, Vercel), and clients that retry them double the load.
+Such work is submitted as a job instead: the request returns 202 with a job
+id at once, and the client polls or streams the status, progress and result.
+
+- Queue: SQLite file (WAL) on local disk, so queued jobs survive restarts
+  and every gunicorn worker claims from the same queue.
+- Workers: ``JOB_WORKERS`` asyncio tasks per process, started on app startup.
+  A claim is a single ``UPDATE ... RETURNING``, so a job runs exactly once.
+- Idempotency: a repeated (kind, Idempotency-Key) with the same request
+  returns the existing job; reusing the key for a different request raises
+  ``IdempotencyConflict`` (HTTP 422).
+- Results expire ``JOB_RESULT_TTL`` seconds after completion; running jobs
+  whose heartbeat goes stale (worker crashed) are requeued.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+import logging
+
+from .shared_state import LocalConnection, store
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+JOBS_DB_PATH = Path(os.getenv("JOBS_DB_PATH", str(BACKEND_DIR / "data" / "jobs.db")))
+JOBS_FILES_DIR = Path(os.getenv("JOBS_FILES_DIR", str(BACKEND_DIR / "data" / "jobs")))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", 24 * 3600))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", 300))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+POLL_INTERVAL = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    idempotency_key TEXT,
+    request_hash TEXT,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    progress_message TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    expires_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_idempotency ON jobs (kind, idempotency_key);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (expires_at);
+"""
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+# progress(fraction 0..1, message)
+ProgressCallback = Callable[[float, Optional[str]], None]
+JobHandler = Callable[[Dict[str, Any], ProgressCallback], Awaitable[Any]]
+
+
+class IdempotencyConflict(ValueError):
+    """An Idempotency-Key was reused for a request with a different payload."""
+
+
+def request_hash(fingerprint: Any) -> str:
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _setup(conn: sqlite3.Connection) -> None:
+    conn.executescript(_SCHEMA)
+
+
+class JobQueue:
+    def __init__(self, path: Path, files_dir: Path):
+        self.path = Path(path)
+        self.files_dir = Path(files_dir)
+        self.handlers: Dict[str, JobHandler] = {}
+        # Job state is the durable record of accepted work: keep the default synchronous=FULL
+        self._conn = LocalConnection(self.path, _setup, timeout=10.0, synchronous="FULL", row_factory=sqlite3.Row)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: list = []
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self.handlers[kind] = handler
+
+    def job_dir(self, job_id: str) -> Path:
+        """Scratch directory for a job's input files, removed when the job expires."""
+        path = self.files_dir / job_id
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    # --------- Submission and lookup ---------
+    def submit(self, kind: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None,
+               job_id: Optional[str] = None, fingerprint: Any = None) -> Dict[str, Any]:
+        """Queue a job. ``fingerprint`` identifies the request for idempotency checks
+        (defaults to the payload; pass it when the payload holds per-submission paths)."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        digest = request_hash(payload if fingerprint is None else fingerprint)
+        if idempotency_key:
+            existing = self._existing(kind, idempotency_key, digest)
+            if existing is not None:
+                return existing
+        job_id = job_id or uuid.uuid4().hex
+        try:
+            self._conn().execute(
+                "INSERT INTO jobs (id, kind, idempotency_key, request_hash, status, payload, created_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, idempotency_key, digest, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+        except sqlite3.IntegrityError:
+            # Same idempotency key submitted concurrently by another worker
+            return self._existing(kind, idempotency_key, digest)
+        store.incr(f"jobs.{kind}.submitted")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return self.get(job_id)
+
+    def _existing(self, kind: str, idempotency_key: str, digest: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM jobs WHERE kind = ? AND idempotency_key = ?", (kind, idempotency_key)
+        ).fetchone()
+        if row is None:
+            return None
+        if row["request_hash"] != digest:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+        return self._to_dict(row)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": row["progress"],
+            "progress_message": row["progress_message"],
+            "result": json.loads(row["result"]) if row["result"] is not None else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "expires_at": row["expires_at"],
+        }
+
+    # --------- Worker side ---------
+    def _claim(self) -> Optional[sqlite3.Row]:
+        if not self.handlers:
+            return None
+        now = time.time()
+        # Only claim kinds this process can run (app.main and main_old register different handlers)
+        kinds = list(self.handlers)
+        placeholders = ",".join("?" * len(kinds))
+        rows = self._conn().execute(
+            "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, attempts = attempts + 1 "
+            f"WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) "
+            "ORDER BY created_at LIMIT 1) AND status = 'queued' RETURNING *",
+            (now, now, *kinds),
+        ).fetchall()  # fetch everything so the statement (and its write lock) completes
+        return rows[0] if rows else None
+
+    def _progress_callback(self, job_id: str) -> ProgressCallback:
+        def report(fraction: float, message: Optional[str] = None) -> None:
+            self._conn().execute(
+                "UPDATE jobs SET progress = ?, progress_message = ?, heartbeat_at = ? WHERE id = ?",
+                (max(0.0, min(1.0, fraction)), message, time.time(), job_id),
+            )
+        return report
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        now = time.time()
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END, "
+            "finished_at = ?, expires_at = ? WHERE id = ?",
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+             status, now, now + JOB_RESULT_TTL, job_id),
+        )
+
+    async def _heartbeat(self, job_id: str) -> None:
+        # Keeps quiet long-running handlers from being mistaken for a crashed worker
+        while True:
+            await asyncio.sleep(JOB_STALE_AFTER / 4)
+            try:
+                self._conn().execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+            except sqlite3.Error as e:
+                logger.warning(f"Job {job_id} heartbeat failed: {e}")
+
+    async def _run(self, row: sqlite3.Row) -> None:
+        job_id, kind = row["id"], row["kind"]
+        start = time.perf_counter()
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result = await self.handlers[kind](json.loads(row["payload"]), self._progress_callback(job_id))
+            self._finish(job_id, "succeeded", result=result)
+            store.incr(f"jobs.{kind}.succeeded")
+        except asyncio.CancelledError:
+            # Worker shutting down: hand the job back to the queue for another worker
+            self._conn().execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'running'", (job_id,))
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} ({kind}) failed: {e}")
+            self._finish(job_id, "failed", error=str(e) or e.__class__.__name__)
+            store.incr(f"jobs.{kind}.failed")
+        finally:
+            heartbeat.cancel()
+        store.observe(f"jobs.{kind}.duration_ms", (time.perf_counter() - start) * 1000)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error as e:
+                logger.warning(f"Job claim failed: {e}")
+                row = None
+            if row is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(row)
+            except Exception as e:
+                # e.g. the database failed while recording the outcome; the janitor requeues the job
+                # once its heartbeat goes stale, and this worker stays in the pool
+                logger.error(f"Job worker error on {row['id']}: {e}")
+                store.incr("jobs.worker_errors")
+
+    def _requeue_stale(self) -> int:
+        cutoff = time.time() - JOB_STALE_AFTER
+        conn = self._conn()
+        failed = conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Worker lost too many times', finished_at = ?, expires_at = ? "
+            "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+            (time.time(), time.time() + JOB_RESULT_TTL, cutoff, JOB_MAX_ATTEMPTS),
+        ).rowcount
+        requeued = conn.execute(
+            "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat_at < ?", (cutoff,)
+        ).rowcount
+        return failed + requeued
+
+    def purge_expired(self) -> int:
+        conn = self._conn()
+        expired = [r["id"] for r in conn.execute(
+            "SELECT id FROM jobs WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+        ).fetchall()]
+        for job_id in expired:
+            shutil.rmtree(self.files_dir / job_id, ignore_errors=True)
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(expired)
+
+    async def _janitor(self) -> None:
+        while True:
+            try:
+                self._requeue_stale()
+                self.purge_expired()
+            except sqlite3.Error as e:
+                logger.warning(f"Job janitor failed: {e}")
+            await asyncio.sleep(60)
+
+    def start(self, workers: int = JOB_WORKERS) -> None:
+        """Start the worker pool on the running event loop (call from app startup)."""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        self._tasks.append(asyncio.create_task(self._janitor()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+# Global job queue instance
+job_queue = JobQueue(JOBS_DB_PATH, JOBS_FILES_DIR)
@@ -0,0 +1,115 @@
+"""
+Local language/script detection for SmartLiva translation
+
+Cheap, dependency-free checks that run before any upstream translation call:
+- which language a text is written in (Thai Unicode block vs Latin letters)
+- whether a text is made only of non-translatable tokens (numbers, units,
+  fibrosis stages, lab acronyms) such as "8.7 kPa" or "F3 (ALT 45 U/L)"
+- which spans of a mixed Thai/English text are foreign to the target
+  language, so only those are sent upstream
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+THAI_LETTER_RE = re.compile(r"[ก-๎]")
+LATIN_LETTER_RE = re.compile(r"[A-Za-zÀ-ɏ]")
+
+# Thai run | Latin word (may carry digits/slashes, e.g. "F3", "mg/dL") | number | any other char
+_TOKEN_RE = re.compile(
+    r"[฀-๿]+"
+    r"|[A-Za-zµÀ-ɏ][A-Za-z0-9µÀ-ɏ'/\-]*"
+    r"|[+\-±]?\d+(?:[.,]\d+)*"
+    r"|\s+"
+    r"|."
+)
+
+# Measurement units and clinical codes that read the same in Thai and English reports
+PASSTHROUGH_TOKENS = {
+    "kpa", "m/s", "cm", "mm", "ml", "l", "kg", "g", "mg", "ug", "µg", "mcg",
+    "mg/dl", "g/dl", "u/l", "iu/l", "iu/ml", "µmol/l", "umol/l", "mmol/l", "db/m",
+    "hz", "mhz", "khz", "bmi", "x", "min", "sec", "s", "h", "hr",
+}
+_STAGE_RE = re.compile(r"^(?:[FSA][0-4](?:-[0-4])?|[FSA]?[0-4]-[0-4])$", re.IGNORECASE)
+# Lab, imaging and scoring acronyms kept as written in both languages. An explicit list:
+# reports typed in capitals ("NO FOCAL LESION") are ordinary words that must be translated.
+CLINICAL_ACRONYMS = {
+    "ALT", "AST", "ALP", "GGT", "LDH", "INR", "PT", "PTT", "APTT", "AFP", "CEA", "CA19-9",
+    "HBV", "HCV", "HAV", "HDV", "HEV", "HIV", "HBSAG", "HBEAG", "ANTI-HBS", "ANTI-HCV", "DNA", "RNA",
+    "CBC", "WBC", "RBC", "PLT", "HB", "HCT", "BUN", "CR", "EGFR", "HBA1C", "TG", "LDL", "HDL",
+    "US", "CT", "MRI", "MRCP", "ERCP", "CEUS", "PET", "EUS", "SWE", "TE", "CAP", "ARFI", "MRE", "PDFF",
+    "HCC", "CCA", "FNH", "NAFLD", "NASH", "MASLD", "MASH", "ALD", "PBC", "PSC", "AIH", "DILI", "TIPS",
+    "TACE", "RFA", "MWA", "MELD", "APRI", "FIB-4", "LI-RADS", "BCLC", "ECOG", "IU", "ROI", "SD", "IQR",
+}
+# Codes with a digit (LR-5, T2, CA19-9) are never ordinary words
+_CODE_RE = re.compile(r"^[A-Z]+[A-Z\-]*\d[A-Z0-9\-]*$")
+
+
+def _token_class(token: str) -> str:
+    """Classify a token as "th", "en" or "neutral" (never needs translating)."""
+    if THAI_LETTER_RE.search(token):
+        return "th"
+    if not LATIN_LETTER_RE.search(token) and "µ" not in token:
+        return "neutral"
+    if (token.lower() in PASSTHROUGH_TOKENS or _STAGE_RE.match(token)
+            or (token.isupper() and (token in CLINICAL_ACRONYMS or _CODE_RE.match(token)))):
+        return "neutral"
+    return "en"
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    return [(t, _token_class(t)) for t in _TOKEN_RE.findall(text)]
+
+
+def detect_language(text: str) -> Optional[str]:
+    """Return "th", "en", or None when the text holds only neutral tokens."""
+    thai = latin = 0
+    for token, cls in tokenize(text):
+        if cls == "th":
+            thai += len(THAI_LETTER_RE.findall(token))
+        elif cls == "en":
+            latin += len(LATIN_LETTER_RE.findall(token))
+    if thai == 0 and latin == 0:
+        return None
+    # Thai spells words with fewer letters than English; weight it up so mixed text leans Thai
+    return "th" if thai * 2 >= latin else "en"
+
+
+def is_passthrough(text: str) -> bool:
+    """True if the text holds nothing translatable (numbers, units, stages, acronyms)."""
+    return all(cls == "neutral" for _, cls in tokenize(text))
+
+
+def split_foreign_spans(text: str, target_language: str) -> List[Tuple[str, bool]]:
+    """Split text into ordered (span, needs_translation) pairs for a target language.
+
+    Neutral tokens between two foreign tokens join the foreign span, so a
+    phrase such as "liver stiffness of 8.7 kPa" is translated as one unit.
+    Joining the spans always reproduces the input exactly.
+    """
+    tokens = tokenize(text)
+    foreign = [cls not in ("neutral", target_language) for _, cls in tokens]
+
+    spans: List[Tuple[str, bool]] = []
+    i = 0
+    while i < len(tokens):
+        if foreign[i]:
+            # Extend to the last foreign token reachable through neutral tokens only
+            end = i
+            j = i + 1
+            while j < len(tokens) and (foreign[j] or tokens[j][1] == "neutral"):
+                if foreign[j]:
+                    end = j
+                j += 1
+            spans.append(("".join(t for t, _ in tokens[i:end + 1]), True))
+            i = end + 1
+        else:
+            start = i
+            while i < len(tokens) and not foreign[i]:
+                i += 1
+            spans.append(("".join(t for t, _ in tokens[start:i]), False))
+    return spans
+
+
+def needs_translation(text: str, target_language: str) -> bool:
+    return any(foreign for _, foreign in split_foreign_spans(text, target_language))
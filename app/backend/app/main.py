@@ -1,8 +1,11 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
 import uvicorn
 import os
+import json
+import time
+import hashlib
 from pathlib import Path
 from typing import List, Optional
 
@@ -15,7 +18,7 @@ except Exception:
 
 try:
     # Optional dependency: OpenAI
-    from openai import OpenAI  # type: ignore
+    from openai import AsyncOpenAI  # type: ignore
     _openai_available = True
 except Exception:
     _openai_available = False
@@ -27,8 +30,67 @@ try:
 except Exception:
     _translation_available = False
 
+from .shared_state import store
+from .semantic_cache import semantic_cache
+from .jobs import job_queue
+from .job_routes import router as job_router
+from .prediction_history import prediction_history
+from .prediction_routes import router as prediction_router
+from .chat_sessions import chat_sessions
+from .model_router import record_route, route_chat
+from .terminology import LANGUAGE_NAMES, SUPPORTED_LANGUAGES, enforce_terminology, glossary_prompt
+from . import admission
+
+CHAT_CACHE_TTL = float(os.environ.get("CHAT_CACHE_TTL", 3600))
+
+SYSTEM_PROMPT = (
+    "You are Dr. HepaSage, a world-renowned hepatologist providing evidence-based, educational information about liver health. "
+    "Focus ONLY on hepatology (hepatitis, fibrosis staging F0-F4, fatty liver, cirrhosis complications, HCC screening, portal hypertension, transplantation, autoimmune/drug-induced liver disease, lifestyle factors). "
+    "If user asks something non-liver-related, politely redirect to liver topics. "
+    "IMPORTANT: Always respond in the SAME LANGUAGE that the user uses (Thai, German, English, or any other language). "
+    "Explain terms clearly, structure answers with short paragraphs or bullet points where helpful, and ALWAYS end with this disclaimer in the user's language: *Medical Disclaimer: This information is for educational purposes only and should not replace professional medical advice. Please consult a qualified healthcare provider.*"
+)
+
+NOT_LIVER_RELATED_REPLY = "As Dr. HepaSage, I specialize in liver health and hepatology. I can provide detailed information about hepatitis, cirrhosis, fatty liver disease, liver cancer, liver function tests, and liver health maintenance. Could you please ask me something related to liver health instead?"
+# Canned redirect in the fused target language (English otherwise)
+NOT_LIVER_RELATED_REPLIES = {
+    "th": "Dr. HepaSage เชี่ยวชาญด้านสุขภาพตับและโรคตับ สามารถให้ข้อมูลโดยละเอียดเกี่ยวกับโรคตับอักเสบ ตับแข็ง ไขมันพอกตับ มะเร็งตับ การตรวจการทำงานของตับ และการดูแลสุขภาพตับ กรุณาถามคำถามที่เกี่ยวกับสุขภาพตับแทน",
+}
+
+def build_system_prompt(target_language: Optional[str] = None) -> str:
+    """System prompt; with a target language the answer is generated directly in it (no separate translation call)"""
+    if not target_language:
+        return SYSTEM_PROMPT
+    language = LANGUAGE_NAMES[target_language]
+    prompt = (
+        f"{SYSTEM_PROMPT} "
+        f"OVERRIDE: Write the entire answer, including the disclaimer, in {language} regardless of the language of the question. "
+        "Keep numbers, units, fibrosis stages and lab abbreviations exactly as written."
+    )
+    glossary = glossary_prompt(target_language)
+    if glossary:
+        prompt += f" Use exactly these {language} terms for the English medical terms:\n{glossary}"
+    return prompt
+
+OPENAI_NOT_CONFIGURED_REPLY = "OpenAI API is not configured. Please set OPENAI_API_KEY environment variable to use Dr. HepaSage chat feature."
+
 app = FastAPI(title="SmartLiva API", version="0.1.0")
 
+# Admission control runs inside the metrics middleware so shed requests are counted too.
+# Both are registered before CORS so CORS stays outermost and 429/503 replies carry its headers.
+admission.install(app)
+
+# Request metrics, aggregated across all workers via the shared store
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    store.incr(f"http.requests.{path}.{response.status_code}")
+    store.observe(f"http.latency_ms.{path}", (time.perf_counter() - start) * 1000)
+    return response
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +106,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 # --------- Pydantic Models ---------
@@ -55,6 +118,14 @@ class ChatRequest(BaseModel):
     history: List[Message]
     max_new_tokens: Optional[int] = 300
     temperature: Optional[float] = 0.7
+    # Answer directly in this language (e.g. "th") instead of translating the reply afterwards
+    target_language: Optional[str] = None
+
+class ChatFrame(BaseModel):
+    """One client message on /ws/chat; the session holds the history."""
+    content: str
+    max_new_tokens: int = Field(300, ge=1, le=2000)
+    temperature: float = Field(0.7, ge=0.0, le=2.0)
 
 class ChatResponse(BaseModel):
     reply: str
@@ -69,6 +140,14 @@ async def health():
         "translation_available": _translation_available
     }
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "pid": os.getpid(),
+        "admission": admission.controller.snapshot(),
+        "metrics": store.metrics(),
+    }
+
 # --------- Helper Functions ---------
 def is_liver_related(text: str) -> bool:
     """Check if the question is liver-related"""
@@ -83,46 +162,57 @@ def is_liver_related(text: str) -> bool:
     text_lower = text.lower()
     return any(kw in text_lower for kw in liver_keywords)
 
-def try_openai_chat(history: List[Message], max_tokens: int, temperature: float):
-    """Try OpenAI GPT, return (reply, tokens) or None"""
+def chat_cache_key(history: List[Message], max_tokens: int, temperature: float,
+                   target_language: Optional[str] = None) -> str:
+    """Stable key for an exact-match chat reply cache entry"""
+    payload = json.dumps({
+        "model": os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo"),
+        "history": [[m.role, m.content] for m in history],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "target_language": target_language,
+    }, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+async def try_openai_chat(history: List[Message], max_tokens: int, temperature: float,
+                          system_prompt: str = SYSTEM_PROMPT):
+    """Try OpenAI GPT on the tier picked by the complexity router, return (reply, tokens) or None"""
     if not _openai_available:
         return None
     
     api_key = os.environ.get("OPENAI_API_KEY")
-    model_name = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
     
     if not api_key:
         return None
     
+    turns = [{"role": msg.role, "content": msg.content} for msg in history]
+    route = route_chat(turns, max_tokens)
+    start = time.perf_counter()
     try:
-        client = OpenAI(api_key=api_key)
-        
-        # System prompt
-        system_prompt = (
-            "You are Dr. HepaSage, a world-renowned hepatologist providing evidence-based, educational information about liver health. "
-            "Focus ONLY on hepatology (hepatitis, fibrosis staging F0-F4, fatty liver, cirrhosis complications, HCC screening, portal hypertension, transplantation, autoimmune/drug-induced liver disease, lifestyle factors). "
-            "If user asks something non-liver-related, politely redirect to liver topics. "
-            "IMPORTANT: Always respond in the SAME LANGUAGE that the user uses (Thai, German, English, or any other language). "
-            "Explain terms clearly, structure answers with short paragraphs or bullet points where helpful, and ALWAYS end with this disclaimer in the user's language: *Medical Disclaimer: This information is for educational purposes only and should not replace professional medical advice. Please consult a qualified healthcare provider.*"
-        )
+        # Async client: a slow completion must not block the loop (and admission wake-ups) for other requests
+        client = AsyncOpenAI(api_key=api_key)
         
-        messages = [{"role": "system", "content": system_prompt}]
-        for msg in history:
-            messages.append({"role": msg.role, "content": msg.content})
+        messages = [{"role": "system", "content": system_prompt}, *turns]
         
-        response = client.chat.completions.create(
-            model=model_name,
+        response = await client.chat.completions.create(
+            model=route.model,
             messages=messages,
-            max_tokens=max_tokens,
+            max_tokens=route.max_tokens,
             temperature=temperature
         )
         
         reply = response.choices[0].message.content
         usage = response.usage.total_tokens if response.usage else 0
+        record_route(
+            route, time.perf_counter() - start,
+            response.usage.prompt_tokens if response.usage else None,
+            response.usage.completion_tokens if response.usage else None,
+        )
         
         return (reply, usage)
     except Exception as e:
-        print(f"OpenAI error: {e}")
+        record_route(route, time.perf_counter() - start, error=True)
+        print(f"OpenAI error ({route.tier} tier, {route.model}): {e}")
         return None
 
 # --------- Chat Endpoint ---------
@@ -133,29 +223,176 @@ async def chat_endpoint(req: ChatRequest):
     
     user_message = req.history[-1].content
     
+    target_language = req.target_language
+    if target_language is not None and target_language not in SUPPORTED_LANGUAGES:
+        raise HTTPException(status_code=400, detail=f"Unsupported target language: {target_language}")
+    
     # Check if liver-related
     if not is_liver_related(user_message):
-        return ChatResponse(
-            reply="As Dr. HepaSage, I specialize in liver health and hepatology. I can provide detailed information about hepatitis, cirrhosis, fatty liver disease, liver cancer, liver function tests, and liver health maintenance. Could you please ask me something related to liver health instead?",
-            usage_tokens=50
-        )
+        return ChatResponse(reply=NOT_LIVER_RELATED_REPLIES.get(target_language, NOT_LIVER_RELATED_REPLY), usage_tokens=50)
+    
+    max_tokens = req.max_new_tokens or 300
+    temperature = req.temperature or 0.7
+    cache_key = chat_cache_key(req.history, max_tokens, temperature, target_language)
+    cached = store.cache_get("chat", cache_key)
+    if cached is not None:
+        return ChatResponse(**cached)
+    
+    # Paraphrases of earlier single-turn questions reuse the stored answer
+    # (not in fused mode: the stored answer follows the question's language, not the target)
+    single_turn = len(req.history) == 1 and semantic_cache is not None and target_language is None
+    if single_turn:
+        similar = semantic_cache.lookup(user_message)
+        if similar is not None:
+            return ChatResponse(**similar)
     
     # Try OpenAI
-    openai_attempt = try_openai_chat(req.history, req.max_new_tokens or 300, req.temperature or 0.7)
+    openai_attempt = await try_openai_chat(req.history, max_tokens, temperature, build_system_prompt(target_language))
     if openai_attempt is not None:
         reply, usage = openai_attempt
+        if target_language:
+            reply = enforce_terminology(reply, target_language)
+            store.incr(f"chat.fused.{target_language}")
+        store.cache_set("chat", cache_key, {"reply": reply, "usage_tokens": usage}, CHAT_CACHE_TTL)
+        if single_turn:
+            semantic_cache.add(user_message, reply, usage)
         return ChatResponse(reply=reply, usage_tokens=usage)
     
     # Fallback if OpenAI not available
-    return ChatResponse(
-        reply="OpenAI API is not configured. Please set OPENAI_API_KEY environment variable to use Dr. HepaSage chat feature.",
-        usage_tokens=0
-    )
+    return ChatResponse(reply=OPENAI_NOT_CONFIGURED_REPLY, usage_tokens=0)
+
+async def stream_openai_chat(messages: List[dict], max_tokens: int, temperature: float):
+    """Yield reply text deltas from OpenAI streaming; yields nothing if OpenAI is unavailable"""
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not _openai_available or not api_key:
+        return
+    # messages[0] is the system prompt; route on the conversation itself
+    route = route_chat(messages[1:], max_tokens)
+    start = time.perf_counter()
+    client = AsyncOpenAI(api_key=api_key)
+    try:
+        stream = await client.chat.completions.create(
+            model=route.model,
+            messages=messages,
+            max_tokens=route.max_tokens,
+            temperature=temperature,
+            stream=True,
+            # The final chunk then carries token usage, so streamed turns count in the per-tier metrics
+            extra_body={"stream_options": {"include_usage": True}},
+        )
+        usage = None
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception:
+        record_route(route, time.perf_counter() - start, error=True)
+        raise
+    record_route(route, time.perf_counter() - start, _usage_tokens(usage, "prompt_tokens"),
+                 _usage_tokens(usage, "completion_tokens"))
+
+def _usage_tokens(usage, name: str) -> Optional[int]:
+    # Client versions without a typed chunk.usage leave it as the raw dict
+    if usage is None:
+        return None
+    return usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+
+# --------- WebSocket Chat ---------
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Delta-only chat: the server keeps the session history, the client sends only new messages.
+
+    Client -> {"content": "...", "max_new_tokens"?: int, "temperature"?: float}
+    Server -> {"type": "session", "session_id"} once, then per turn
+              {"type": "delta", "content"}... followed by {"type": "done", "reply"} or {"type": "error", "detail"}
+    Pass ?session_id=... to resume an existing session, and ?target_language=th|en to have
+    every answer generated directly in that language (the "done" reply is terminology-normalised).
+    """
+    await websocket.accept()
+    target_language = websocket.query_params.get("target_language") or None
+    if target_language is not None and target_language not in SUPPORTED_LANGUAGES:
+        await websocket.send_json({"type": "error", "detail": f"Unsupported target language: {target_language}"})
+        await websocket.close(code=1008)
+        return
+    session = chat_sessions.get_or_create(websocket.query_params.get("session_id"), build_system_prompt(target_language))
+    await websocket.send_json({"type": "session", "session_id": session.session_id, "turns": len(session.history)})
+    try:
+        while True:
+            try:
+                frame = ChatFrame.model_validate_json(await websocket.receive_text())
+            except ValidationError as e:
+                error = e.errors()[0]
+                location = ".".join(str(part) for part in error["loc"])
+                await websocket.send_json({"type": "error", "detail": f"Invalid message: {location + ': ' if location else ''}{error['msg']}"})
+                continue
+            content = frame.content.strip()
+            if not content:
+                await websocket.send_json({"type": "error", "detail": "Message content is required"})
+                continue
+            if not is_liver_related(content):
+                await websocket.send_json({"type": "done", "reply": NOT_LIVER_RELATED_REPLIES.get(target_language, NOT_LIVER_RELATED_REPLY)})
+                continue
+            
+            try:
+                await admission.controller.acquire("chat")
+            except admission.Overloaded as e:
+                await websocket.send_json({"type": "error", "detail": e.detail, "retry_after": e.retry_after})
+                continue
+            start = time.perf_counter()
+            try:
+                session.append("user", content)
+                parts = []
+                try:
+                    async for delta in stream_openai_chat(
+                        session.messages, frame.max_new_tokens, frame.temperature
+                    ):
+                        parts.append(delta)
+                        await websocket.send_json({"type": "delta", "content": delta})
+                except WebSocketDisconnect:
+                    # Left mid-answer: drop the unanswered user turn so a resumed session
+                    # does not send two user messages in a row
+                    session.history.pop()
+                    raise
+                except Exception as e:
+                    print(f"OpenAI streaming error: {e}")
+                reply = "".join(parts)
+                if reply and target_language:
+                    reply = enforce_terminology(reply, target_language)
+                    store.incr(f"chat.fused.{target_language}")
+                if not reply:
+                    # Keep the history consistent: drop the unanswered user turn
+                    session.history.pop()
+                    await websocket.send_json({"type": "error", "detail": OPENAI_NOT_CONFIGURED_REPLY})
+                    continue
+                session.append("assistant", reply)
+                chat_sessions.save(session)
+                await websocket.send_json({"type": "done", "reply": reply})
+            finally:
+                admission.controller.release("chat", time.perf_counter() - start)
+    except WebSocketDisconnect:
+        pass
 
 # Include translation routes
 if _translation_available:
     app.include_router(translation_router)
 
+# Background jobs (submit via feature routes, poll/stream via /api/jobs)
+app.include_router(job_router)
+# Stored prediction history (written by the prediction service, read here)
+app.include_router(prediction_router)
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_queue.start()
+    prediction_history.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+    await prediction_history.stop()
+
 if __name__ == "__main__":
+    # Development server only; production runs `python -m app.server`
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True)
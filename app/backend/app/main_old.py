@@ -1,9 +1,14 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
+import asyncio
+import hashlib
 import io
 import os
+import shutil
+import time
+import uuid
 from pathlib import Path
 
 # Optional .env loading (python-dotenv)
@@ -12,11 +17,50 @@ try:
     _dotenv_loaded = load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
 except Exception:
     _dotenv_loaded = False
-from PIL import Image
 import numpy as np
 
-# Removed unused ML imports (torch, transformers, sklearn, etc.)
-# Now using OpenAI API instead of local models
+# Local inference dependencies are not in requirements.txt (the chat path uses the OpenAI API);
+# each is optional so the app imports without them and /predict reports 503 instead
+try:
+    # Optional dependency: torch
+    import torch  # type: ignore
+    _torch_available = True
+except Exception:
+    _torch_available = False
+
+try:
+    # Optional dependency: open_clip (fibrosis regressor backbone)
+    import open_clip  # type: ignore
+    _open_clip_available = True
+except Exception:
+    _open_clip_available = False
+
+try:
+    # Optional dependencies: image decoding and preprocessing
+    from PIL import Image  # type: ignore
+    import albumentations as A  # type: ignore
+    import albumentations.pytorch as AP  # type: ignore
+    from sklearn.preprocessing import StandardScaler  # type: ignore
+    _preprocessing_available = True
+except Exception:
+    _preprocessing_available = False
+
+try:
+    # Optional dependency: transformers (legacy local-model loaders below)
+    from transformers import (  # type: ignore
+        AutoConfig,
+        AutoImageProcessor,
+        AutoModelForCausalLM,
+        AutoModelForImageClassification,
+        AutoTokenizer,
+    )
+    _transformers_available = True
+except Exception:
+    _transformers_available = False
+
+_local_models_available = (
+    _torch_available and _open_clip_available and _preprocessing_available and _transformers_available
+)
 
 try:
     # Optional dependency: OpenAI
@@ -32,7 +76,15 @@ try:
 except Exception:
     _translation_available = False
 
+from . import admission
+from .jobs import IdempotencyConflict, job_queue
+from .model_weights import load_shared
+from .prediction_history import prediction_history
+from .prediction_routes import router as prediction_router
+from .job_routes import accepted, router as job_router
+
 app = FastAPI(title="SmartLiva API", version="0.1.0")
+admission.install(app)
 
 # CORS Configuration for Vercel + Local Dev
 app.add_middleware(
@@ -47,6 +99,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 # --------- Models (Lazy Load) ---------
@@ -73,20 +126,28 @@ label_mapping = {
 
 def load_fibrosis_model():
     if BUNDLE.clip_model is None:
-        clip_model, _, _ = open_clip.create_model_and_transforms("ViT-B-32", pretrained="openai")
-        BUNDLE.clip_model = clip_model
+        # Weights are memory-mapped from MODEL_DIR so every worker shares one copy
+        BUNDLE.clip_model = load_shared(
+            "clip_vit_b32_openai",
+            build_skeleton=lambda: open_clip.create_model("ViT-B-32", pretrained=None),
+            load_pretrained=lambda: open_clip.create_model_and_transforms("ViT-B-32", pretrained="openai")[0],
+        )
     return BUNDLE.clip_model
 
 
 def load_classification_model():
     if BUNDLE.classification_model is None:
         processor = AutoImageProcessor.from_pretrained("timm/maxvit_large_tf_224.in1k")
-        model = AutoModelForImageClassification.from_pretrained(
-            "timm/maxvit_large_tf_224.in1k",
-            num_labels=len(label_mapping),
-            ignore_mismatched_sizes=True
+        config = AutoConfig.from_pretrained("timm/maxvit_large_tf_224.in1k", num_labels=len(label_mapping))
+        model = load_shared(
+            "maxvit_large_tf_224_liver",
+            build_skeleton=lambda: AutoModelForImageClassification.from_config(config),
+            load_pretrained=lambda: AutoModelForImageClassification.from_pretrained(
+                "timm/maxvit_large_tf_224.in1k",
+                num_labels=len(label_mapping),
+                ignore_mismatched_sizes=True
+            ),
         )
-        model.eval()
         BUNDLE.classification_model = model
         BUNDLE.classification_processor = processor
     return BUNDLE.classification_model, BUNDLE.classification_processor
@@ -108,7 +169,7 @@ def load_chat_model():
     return BUNDLE.chat_model, BUNDLE.chat_tokenizer
 
 
-class CLIPRegressor(torch.nn.Module):
+class CLIPRegressor(torch.nn.Module if _torch_available else object):
     def __init__(self, clip_model, meta_dim=3, hidden_dim=512):
         super().__init__()
         self.clip_model = clip_model
@@ -142,7 +203,7 @@ def get_scaler():
     return BUNDLE.scaler
 
 
-def preprocess_fibrosis_image(image: Image.Image, view_type: str):
+def preprocess_fibrosis_image(image: "Image.Image", view_type: str):
     img = np.array(image.convert("L"))
     img = np.stack([img, img, img], axis=-1)
     transform = A.Compose([
@@ -258,14 +319,10 @@ def try_openai_chat(history: list[ChatMessage], max_new_tokens: int, temperature
         return None
 
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict(
-    file: UploadFile = File(...),
-    view_type: str = Form("Intercostal"),
-    swe_stage: str = Form("Unknown")
-):
-    # Load image
-    content = await file.read()
+def run_prediction(content: bytes, view_type: str, swe_stage: str) -> PredictionResponse:
+    """Fibrosis regression + lesion classification for one encoded image."""
+    if not _local_models_available:
+        raise HTTPException(status_code=503, detail="Local inference models are not installed on this server")
     image = Image.open(io.BytesIO(content))
 
     # Fibrosis prediction
@@ -300,6 +357,92 @@ async def predict(
     )
 
 
+@app.post("/predict", response_model=PredictionResponse)
+async def predict(
+    file: UploadFile = File(...),
+    view_type: str = Form("Intercostal"),
+    swe_stage: str = Form("Unknown"),
+    patient_id: str | None = Form(None),
+    study_id: str | None = Form(None),
+):
+    start = time.perf_counter()
+    content = await file.read()
+    inference_start = time.perf_counter()
+    # torch inference blocks; run it off the event loop so admission can still wake queued requests
+    prediction = await asyncio.to_thread(run_prediction, content, view_type, swe_stage)
+    end = time.perf_counter()
+    prediction_history.record(
+        prediction.model_dump(), patient_id=patient_id, study_id=study_id, filename=file.filename,
+        view_type=view_type, swe_stage=swe_stage,
+        inference_ms=(end - inference_start) * 1000, total_ms=(end - start) * 1000,
+    )
+    return prediction
+
+
+async def run_prediction_job(payload: dict, progress) -> dict:
+    """Job handler: predict each uploaded image in turn, reporting progress per image."""
+    results = []
+    total = len(payload["files"])
+    job_id = payload.get("job_id")
+    for done, item in enumerate(payload["files"], start=1):
+        content = Path(item["path"]).read_bytes()
+        start = time.perf_counter()
+        prediction = await asyncio.to_thread(run_prediction, content, payload["view_type"], payload["swe_stage"])
+        inference_ms = (time.perf_counter() - start) * 1000
+        prediction_history.record(
+            prediction.model_dump(), patient_id=payload.get("patient_id"), study_id=payload.get("study_id"),
+            filename=item["filename"], view_type=payload["view_type"], swe_stage=payload["swe_stage"],
+            inference_ms=inference_ms, total_ms=inference_ms,
+            # A requeued job re-runs every file; a stable id keeps each one recorded once
+            record_id=f"{job_id}-{done}" if job_id else None,
+        )
+        results.append({"filename": item["filename"], **prediction.model_dump()})
+        progress(done / total, f"Analyzed {done}/{total} images")
+    return {"predictions": results}
+
+
+job_queue.register("predict", run_prediction_job)
+
+
+@app.post("/predict/jobs", status_code=202)
+async def submit_prediction_job(
+    files: list[UploadFile] = File(...),
+    view_type: str = Form("Intercostal"),
+    swe_stage: str = Form("Unknown"),
+    patient_id: str | None = Form(None),
+    study_id: str | None = Form(None),
+    idempotency_key: str | None = Header(None),
+):
+    """Queue prediction of one or more images; poll /api/jobs/{job_id} for results."""
+    job_id = uuid.uuid4().hex
+    job_dir = job_queue.job_dir(job_id)
+    stored = []
+    digests = []
+    for index, upload in enumerate(files):
+        path = job_dir / f"{index}{Path(upload.filename or '').suffix}"
+        content = await upload.read()
+        path.write_bytes(content)
+        stored.append({"filename": upload.filename, "path": str(path)})
+        digests.append(hashlib.sha256(content).hexdigest())
+    options = {"view_type": view_type, "swe_stage": swe_stage, "patient_id": patient_id, "study_id": study_id}
+    try:
+        job = job_queue.submit(
+            "predict",
+            {"files": stored, "job_id": job_id, **options},
+            idempotency_key=idempotency_key,
+            job_id=job_id,
+            # Stored paths differ per submission; identify the request by file contents instead
+            fingerprint={"files": digests, **options},
+        )
+    except IdempotencyConflict as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise HTTPException(status_code=422, detail=str(e))
+    if job["job_id"] != job_id:
+        # Idempotent retry of an earlier submission; its files are already stored
+        shutil.rmtree(job_dir, ignore_errors=True)
+    return accepted(job)
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -361,7 +504,9 @@ async def chat_endpoint(req: ChatRequest):
     user_message = req.history[-1].content
 
     # If OpenAI key present, attempt OpenAI first (provides better medical grounding)
-    openai_attempt = try_openai_chat(req.history, req.max_new_tokens or 300, req.temperature or 0.7)
+    openai_attempt = await asyncio.to_thread(
+        try_openai_chat, req.history, req.max_new_tokens or 300, req.temperature or 0.7
+    )
     if openai_attempt is not None:
         reply, usage = openai_attempt
         return ChatResponse(reply=reply, usage_tokens=usage)
@@ -373,26 +518,28 @@ async def chat_endpoint(req: ChatRequest):
             usage_tokens=50
         )
     
-    model, tokenizer = load_chat_model()
-    
     # Build specialized prompt
     prompt = build_liver_context_prompt(req.history[:-1], user_message)
     
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=800)
-    with torch.no_grad():
-        output_ids = model.generate(
-            **inputs,
-            max_new_tokens=req.max_new_tokens or 300,
-            temperature=req.temperature or 0.7,
-            do_sample=True,
-            top_p=0.9,
-            repetition_penalty=1.1,
-            pad_token_id=tokenizer.pad_token_id,
-            eos_token_id=tokenizer.eos_token_id,
-            no_repeat_ngram_size=2,
-        )
+    def generate():
+        model, tokenizer = load_chat_model()
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=800)
+        with torch.no_grad():
+            output_ids = model.generate(
+                **inputs,
+                max_new_tokens=req.max_new_tokens or 300,
+                temperature=req.temperature or 0.7,
+                do_sample=True,
+                top_p=0.9,
+                repetition_penalty=1.1,
+                pad_token_id=tokenizer.pad_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+                no_repeat_ngram_size=2,
+            )
+        return output_ids, tokenizer.decode(output_ids[0], skip_special_tokens=True)
     
-    text = tokenizer.decode(output_ids[0], skip_special_tokens=True)
+    # Local generation blocks; keep it off the event loop
+    output_ids, text = await asyncio.to_thread(generate)
     reply = text.split("Dr. HepaSage:")[-1].strip()
     
     if not reply or len(reply) < 20:
@@ -407,6 +554,22 @@ async def chat_endpoint(req: ChatRequest):
 if _translation_available:
     app.include_router(translation_router)
 
+app.include_router(job_router)
+app.include_router(prediction_router)
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_queue.start()
+    prediction_history.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+    await prediction_history.stop()
+
 if __name__ == "__main__":
+    # Development server only; production runs `python -m app.server`
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True)
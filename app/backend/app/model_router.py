@@ -0,0 +1,120 @@
+"""
+Complexity-based model routing for HepaSage chat
+
+Short factual questions ("what is F2 fibrosis?") do not need the model that
+handles multi-turn differential discussions. Each request is scored locally
+from the last user message's length, the conversation depth, the distinct
+medical entities it mentions, complexity cues and its language. Requests
+scoring below ``CHAT_ROUTER_THRESHOLD`` go to the fast tier, the rest to the
+strong tier.
+
+Both tiers default to ``OPENAI_MODEL``, so routing changes nothing until
+``CHAT_MODEL_FAST`` / ``CHAT_MODEL_STRONG`` are set; ``CHAT_FAST_MAX_TOKENS``
+also only applies once the fast tier uses its own model. Per-tier request counts,
+latency and token usage are recorded in the shared store (``/metrics``
+under ``chat.tier.*``) so the gain can be compared per tier.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .language_detect import detect_language
+from .shared_state import store
+
+_DEFAULT_MODEL = os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
+CHAT_MODEL_FAST = os.environ.get("CHAT_MODEL_FAST", _DEFAULT_MODEL)
+CHAT_MODEL_STRONG = os.environ.get("CHAT_MODEL_STRONG", _DEFAULT_MODEL)
+# Score at or above which a request goes to the strong tier
+CHAT_ROUTER_THRESHOLD = float(os.environ.get("CHAT_ROUTER_THRESHOLD", 3.0))
+# Upper bound on completion tokens for a separately configured fast model
+CHAT_FAST_MAX_TOKENS = int(os.environ.get("CHAT_FAST_MAX_TOKENS", 400))
+
+# Distinct entities count once each; several in one question suggest a differential
+MEDICAL_ENTITIES = (
+    "hepatitis", "cirrhosis", "fibrosis", "steatosis", "nafld", "nash", "masld", "mash",
+    "hcc", "hepatocellular", "cholangiocarcinoma", "hemangioma", "cyst", "dysplastic",
+    "ascites", "varices", "encephalopathy", "portal hypertension", "jaundice",
+    "alt", "ast", "ggt", "alp", "bilirubin", "albumin", "inr", "afp", "platelet",
+    "meld", "child-pugh", "fib-4", "apri", "fibroscan", "elastography", "kpa",
+    "biopsy", "ultrasound", "ct", "mri", "transplant", "tenofovir", "entecavir",
+    "sofosbuvir", "steroid", "statin", "alcohol",
+    "ตับอักเสบ", "ตับแข็ง", "พังผืด", "ไขมันพอกตับ", "มะเร็งตับ", "ท้องมาน", "ดีซ่าน",
+    "เส้นเลือดขอด", "ปลูกถ่ายตับ", "ค่าตับ", "ไวรัสตับ",
+)
+
+# Phrases that ask for reasoning rather than a definition
+COMPLEXITY_CUES = (
+    "differential", "compare", "versus", " vs ", "why", "how does", "mechanism", "management",
+    "treatment plan", "interpret", "contraindicat", "interaction", "prognosis", "next step",
+    "should i", "what if", "เปรียบเทียบ", "ทำไม", "แตกต่าง", "วินิจฉัยแยกโรค", "แนวทางการรักษา",
+)
+
+_WORD_RE = re.compile(r"[a-z0-9\-]+")
+_STAGE_RE = re.compile(r"\b[fs][0-4]\b")
+
+
+@dataclass
+class Route:
+    tier: str
+    model: str
+    score: float
+    max_tokens: int
+    reasons: Dict[str, float] = field(default_factory=dict)
+
+
+def count_entities(text: str) -> int:
+    lowered = text.lower()
+    words = set(_WORD_RE.findall(lowered))
+    found = 0
+    for entity in MEDICAL_ENTITIES:
+        # Short Latin acronyms must match whole words ("ct" inside "fact" is not CT)
+        if entity.isascii() and " " not in entity and len(entity) <= 5:
+            found += entity in words
+        else:
+            found += entity in lowered
+    return found + len(set(_STAGE_RE.findall(lowered)))
+
+
+def score_request(history: List[Dict[str, str]]) -> Dict[str, float]:
+    """Per-feature complexity contributions for a chat history ending in a user turn."""
+    question = history[-1]["content"] if history else ""
+    lowered = question.lower()
+    language = detect_language(question)
+    # Thai has no spaces between words; approximate words by characters
+    words = len(question) / 6 if language == "th" else len(question.split())
+    return {
+        "length": min(words / 40, 2.0),
+        "depth": min((len(history) - 1) / 4, 2.0),
+        "entities": max(count_entities(question) - 1, 0) * 0.75,
+        "cues": 1.5 if any(cue in lowered for cue in COMPLEXITY_CUES) else 0.0,
+        # The fast tier is noticeably weaker outside English
+        "language": 0.5 if language not in (None, "en") else 0.0,
+    }
+
+
+def route_chat(history: List[Dict[str, str]], max_tokens: int) -> Route:
+    reasons = score_request(history)
+    score = round(sum(reasons.values()), 3)
+    if score < CHAT_ROUTER_THRESHOLD:
+        # With one model for both tiers the cap would only truncate answers
+        if CHAT_MODEL_FAST != CHAT_MODEL_STRONG:
+            max_tokens = min(max_tokens, CHAT_FAST_MAX_TOKENS)
+        return Route("fast", CHAT_MODEL_FAST, score, max_tokens, reasons)
+    return Route("strong", CHAT_MODEL_STRONG, score, max_tokens, reasons)
+
+
+def record_route(route: Route, latency_s: float, prompt_tokens: Optional[int] = None,
+                 completion_tokens: Optional[int] = None, error: bool = False) -> None:
+    prefix = f"chat.tier.{route.tier}"
+    store.incr(f"{prefix}.requests")
+    if error:
+        store.incr(f"{prefix}.errors")
+        return
+    store.observe(f"{prefix}.latency_ms", latency_s * 1000)
+    if prompt_tokens is not None:
+        store.incr(f"{prefix}.prompt_tokens", prompt_tokens)
+    if completion_tokens is not None:
+        store.incr(f"{prefix}.completion_tokens", completion_tokens)
+        store.observe(f"{prefix}.completion_tokens_per_request", completion_tokens)
@@ -0,0 +1,214 @@
+"""
+Memory-mapped model weights shared across worker processes
+
+``from_pretrained`` reads every weight into private memory, so N gunicorn
+workers hold N copies of MaxViT-Large and CLIP. Instead, weights are
+exported once to ``MODEL_DIR/<name>.safetensors`` and every worker maps the
+file copy-on-write: tensors point straight into the page cache, so all
+workers share one physical copy and a new worker "loads" in the time it
+takes to build the module skeleton.
+
+The model skeleton is built on the ``meta`` device (no allocation, no random
+init) and its parameters/buffers are then bound to the mapped tensors.
+Non-persistent buffers and tied weights are stored too, so the mapped model
+is complete without ``load_state_dict``.
+
+Measured per worker from ``/proc/<pid>/smaps_rollup``, using a 600 MB
+float32 weights file (CLIP ViT-B/32 size) and forked workers that each read
+every weight once. Loading with ``map_arrays`` was compared against reading
+into private memory, which is what ``from_pretrained`` does:
+
+    workers  loading   RSS/worker  private/worker    PSS/worker  total PSS
+    1        private   622 MB      601 MB            611 MB      611 MB
+    4        private   620 MB      601 MB            605 MB      2421 MB
+    1        mapped    620 MB      600 MB (clean)    610 MB      610 MB
+    4        mapped    620 MB      1 MB              155 MB      681 MB
+
+Mapping took 1 ms per worker; the private read took 0.55 s. ``load_mapped``
+only wraps these arrays with ``torch.from_numpy``, which does not copy; torch
+and open_clip were not installable where this was measured, so the full
+model load itself has not been run. RSS stays flat because it counts a
+mapped page in every worker that touched it; compare PSS
+(``smem -P gunicorn``) or the ``Private_*`` lines instead.
+
+Delete the ``.safetensors`` files after changing a model's weights or heads;
+they are re-exported on the next load.
+"""
+
+import json
+import mmap
+import os
+import struct
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+import logging
+
+import numpy as np
+
+try:
+    import torch
+    _torch_available = True
+except Exception:
+    _torch_available = False
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+MODEL_DIR = Path(os.getenv("MODEL_DIR", str(BACKEND_DIR / "models")))
+
+# safetensors dtype tag -> (numpy storage dtype, torch dtype name)
+_DTYPES = {
+    "F64": (np.float64, "float64"),
+    "F32": (np.float32, "float32"),
+    "F16": (np.float16, "float16"),
+    "BF16": (np.int16, "bfloat16"),  # numpy has no bfloat16; reinterpret the bits in torch
+    "I64": (np.int64, "int64"),
+    "I32": (np.int32, "int32"),
+    "I16": (np.int16, "int16"),
+    "I8": (np.int8, "int8"),
+    "U8": (np.uint8, "uint8"),
+    "BOOL": (np.bool_, "bool"),
+}
+_TORCH_TO_TAG = {torch_name: tag for tag, (_, torch_name) in _DTYPES.items()}
+
+# Open mappings stay referenced for the life of the process
+_MAPPINGS: Dict[str, mmap.mmap] = {}
+
+
+def weights_path(name: str) -> Path:
+    return MODEL_DIR / f"{name}.safetensors"
+
+
+# --------- safetensors file format (header length, JSON header, raw data) ---------
+def read_header(path: Path) -> Tuple[Dict, int]:
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+    return header, 8 + header_len
+
+
+def map_arrays(path: Path) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+    """Map a safetensors file copy-on-write; returns (name -> array view, metadata)."""
+    header, data_start = read_header(path)
+    key = str(path)
+    if key not in _MAPPINGS:
+        with open(path, "rb") as f:
+            # ACCESS_COPY (MAP_PRIVATE): pages come from the shared page cache and are
+            # only duplicated if a process writes to them, which inference never does
+            _MAPPINGS[key] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    buf = _MAPPINGS[key]
+    metadata = header.pop("__metadata__", {}) or {}
+    arrays = {}
+    for name, info in header.items():
+        np_dtype, _ = _DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        count = (end - begin) // np.dtype(np_dtype).itemsize
+        arrays[name] = np.frombuffer(buf, dtype=np_dtype, count=count, offset=data_start + begin).reshape(info["shape"])
+    return arrays, metadata
+
+
+def write_safetensors(path: Path, tensors: Dict[str, "torch.Tensor"], metadata: Dict[str, str]) -> None:
+    header: Dict = {"__metadata__": metadata}
+    blobs = []
+    offset = 0
+    for name, tensor in tensors.items():
+        tensor = tensor.detach().to("cpu").contiguous()
+        dtype_name = str(tensor.dtype).replace("torch.", "")
+        if dtype_name == "bfloat16":
+            data = tensor.view(torch.int16).numpy().tobytes()
+        else:
+            data = tensor.numpy().tobytes()
+        header[name] = {"dtype": _TORCH_TO_TAG[dtype_name], "shape": list(tensor.shape),
+                        "data_offsets": [offset, offset + len(data)]}
+        blobs.append(data)
+        offset += len(data)
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 8)  # keep tensor data 8-byte aligned
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for data in blobs:
+            f.write(data)
+    tmp.replace(path)
+
+
+# --------- torch integration ---------
+def _named_tensors(model: "torch.nn.Module") -> Tuple[Dict[str, "torch.Tensor"], Dict[str, str]]:
+    """All parameters and buffers (incl. non-persistent), deduplicating tied weights."""
+    tensors: Dict[str, "torch.Tensor"] = {}
+    aliases: Dict[str, str] = {}
+    seen: Dict[Tuple[int, int], str] = {}
+    named = list(model.named_parameters(remove_duplicate=False)) + list(model.named_buffers(remove_duplicate=False))
+    for name, tensor in named:
+        if tensor is None:
+            continue
+        identity = (id(tensor), tensor.data_ptr())
+        if identity in seen:
+            aliases[name] = seen[identity]
+        else:
+            seen[identity] = name
+            tensors[name] = tensor
+    return tensors, aliases
+
+
+def export_weights(model: "torch.nn.Module", name: str) -> Path:
+    tensors, aliases = _named_tensors(model)
+    path = weights_path(name)
+    write_safetensors(path, tensors, {"aliases": json.dumps(aliases)})
+    logger.info(f"Exported {len(tensors)} tensors for {name} to {path}")
+    return path
+
+
+def _bind(model: "torch.nn.Module", name: str, tensor: "torch.Tensor", is_param: bool) -> None:
+    module_path, _, leaf = name.rpartition(".")
+    module = model.get_submodule(module_path) if module_path else model
+    if is_param:
+        module._parameters[leaf] = torch.nn.Parameter(tensor, requires_grad=False)
+    else:
+        module._buffers[leaf] = tensor
+
+
+def load_mapped(build_skeleton: Callable[[], "torch.nn.Module"], name: str) -> "torch.nn.Module":
+    """Build a model on the meta device and bind its tensors to the mapped weights file."""
+    arrays, metadata = map_arrays(weights_path(name))
+    aliases = json.loads(metadata.get("aliases", "{}"))
+    header, _ = read_header(weights_path(name))
+
+    with torch.device("meta"):
+        model = build_skeleton()
+    param_names = {n for n, _ in model.named_parameters(remove_duplicate=False)}
+
+    bound: Dict[str, "torch.Tensor"] = {}
+    with warnings.catch_warnings():
+        # from_numpy warns about the non-writable view; tensors are never written in eval mode
+        warnings.simplefilter("ignore")
+        for tensor_name, array in arrays.items():
+            tensor = torch.from_numpy(array)
+            if header[tensor_name]["dtype"] == "BF16":
+                tensor = tensor.view(torch.bfloat16)
+            bound[tensor_name] = tensor
+    for tensor_name, tensor in bound.items():
+        _bind(model, tensor_name, tensor, tensor_name in param_names)
+    for alias, target in aliases.items():
+        _bind(model, alias, bound[target], alias in param_names)
+
+    missing = [n for n, t in list(model.named_parameters()) + list(model.named_buffers()) if t.is_meta]
+    if missing:
+        raise RuntimeError(f"Mapped weights for {name} are missing tensors: {missing[:5]}")
+    model.eval()
+    return model
+
+
+def load_shared(name: str, build_skeleton: Callable[[], "torch.nn.Module"],
+                load_pretrained: Callable[[], "torch.nn.Module"]) -> "torch.nn.Module":
+    """Map ``name`` from MODEL_DIR, exporting it from the pretrained loader on first use."""
+    if not _torch_available:
+        raise RuntimeError("torch is required to load model weights")
+    if not weights_path(name).exists():
+        model = load_pretrained()
+        export_weights(model, name)
+        del model
+    return load_mapped(build_skeleton, name)
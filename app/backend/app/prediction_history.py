@@ -0,0 +1,244 @@
+"""
+Write-behind prediction history for the SmartLiva dashboard and reports
+
+Predictions were returned and forgotten, so the clinical dashboard and
+reports pages had nothing to show without re-running inference. Every
+prediction is now recorded with its patient/study identifiers and timings:
+
+- ``record()`` only appends to an in-process buffer, so the request path
+  never waits on disk. A flusher task drains the buffer every
+  ``PREDICTION_FLUSH_INTERVAL`` seconds in batches of up to
+  ``PREDICTION_BATCH_SIZE`` records, each written in one transaction to a
+  SQLite file (WAL) shared by all workers.
+- The same transaction upserts the rollups (fibrosis stage distribution,
+  lesion class counts, daily volume and inference time), so dashboard
+  queries read precomputed aggregates instead of scanning predictions.
+
+Records from a job carry a deterministic id (job id + file index) and are
+inserted with ``INSERT OR IGNORE``, so a requeued job re-running the same
+files neither duplicates history nor double-counts the rollups.
+
+Reads are eventually consistent: a prediction shows up within one flush
+interval. If the buffer reaches ``PREDICTION_QUEUE_MAX`` (disk stalled),
+new records are dropped and counted rather than blocking inference.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from .shared_state import LocalConnection, store
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PREDICTION_DB_PATH = Path(os.getenv("PREDICTION_DB_PATH", str(BACKEND_DIR / "data" / "predictions.db")))
+PREDICTION_FLUSH_INTERVAL = float(os.getenv("PREDICTION_FLUSH_INTERVAL", 1.0))
+PREDICTION_BATCH_SIZE = int(os.getenv("PREDICTION_BATCH_SIZE", 200))
+PREDICTION_QUEUE_MAX = int(os.getenv("PREDICTION_QUEUE_MAX", 10000))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT,
+    study_id TEXT,
+    filename TEXT,
+    view_type TEXT,
+    swe_stage TEXT,
+    te_kpa REAL NOT NULL,
+    fibrosis_stage TEXT NOT NULL,
+    classification_label TEXT NOT NULL,
+    classification_confidence REAL NOT NULL,
+    inference_ms REAL,
+    total_ms REAL,
+    created_at REAL NOT NULL,
+    day TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS predictions_patient_page ON predictions (patient_id, created_at, id);
+CREATE INDEX IF NOT EXISTS predictions_study_page ON predictions (study_id, created_at, id);
+CREATE TABLE IF NOT EXISTS prediction_rollups (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    timed INTEGER NOT NULL DEFAULT 0,
+    total_ms REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+_COLUMNS = (
+    "id", "patient_id", "study_id", "filename", "view_type", "swe_stage", "te_kpa", "fibrosis_stage",
+    "classification_label", "classification_confidence", "inference_ms", "total_ms", "created_at", "day",
+)
+
+
+class PredictionHistory:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._pending: deque = deque()
+        self._conn = LocalConnection(self.path, lambda conn: conn.executescript(_SCHEMA), timeout=10.0,
+                                     row_factory=sqlite3.Row)
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # --------- Request path ---------
+    def record(self, prediction: Dict[str, Any], patient_id: Optional[str] = None, study_id: Optional[str] = None,
+               filename: Optional[str] = None, view_type: Optional[str] = None, swe_stage: Optional[str] = None,
+               inference_ms: Optional[float] = None, total_ms: Optional[float] = None,
+               record_id: Optional[str] = None) -> str:
+        """
+        Queue a PredictionResponse (as a dict) for persistence; never touches disk.
+
+        Pass a stable ``record_id`` when the same prediction may be recorded again (job retries);
+        only the first write counts.
+        """
+        record_id = record_id or uuid.uuid4().hex
+        if len(self._pending) >= PREDICTION_QUEUE_MAX:
+            store.incr("predictions.dropped")
+            return record_id
+        now = time.time()
+        self._pending.append((
+            record_id, patient_id, study_id, filename, view_type, swe_stage,
+            prediction["te_kpa"], prediction["fibrosis_stage"], prediction["classification_label"],
+            prediction["classification_confidence"], inference_ms, total_ms,
+            now, datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d"),
+        ))
+        return record_id
+
+    # --------- Flushing ---------
+    def flush(self) -> int:
+        """Write up to one batch of pending records; returns how many were written."""
+        with self._flush_lock:
+            batch = []
+            while self._pending and len(batch) < PREDICTION_BATCH_SIZE:
+                batch.append(self._pending.popleft())
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except sqlite3.Error as e:
+                # Put the batch back in order and retry on the next flush
+                self._pending.extendleft(reversed(batch))
+                logger.warning(f"Prediction history flush failed: {e}")
+                return 0
+        store.incr("predictions.flushed", len(batch))
+        return len(batch)
+
+    def _write(self, batch: List[tuple]) -> None:
+        stages: Counter = Counter()
+        lesions: Counter = Counter()
+        days: Counter = Counter()
+        day_timed: Counter = Counter()
+        day_ms: Counter = Counter()
+        insert = f"INSERT OR IGNORE INTO predictions ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for row in batch:
+                if conn.execute(insert, row).rowcount == 0:
+                    # Already recorded (retried job); the rollups counted it the first time
+                    continue
+                record = dict(zip(_COLUMNS, row))
+                stages[record["fibrosis_stage"]] += 1
+                lesions[record["classification_label"]] += 1
+                days[record["day"]] += 1
+                if record["inference_ms"] is not None:
+                    day_timed[record["day"]] += 1
+                    day_ms[record["day"]] += record["inference_ms"]
+            rollups = (
+                [("stage", key, n, 0, 0.0) for key, n in stages.items()]
+                + [("lesion", key, n, 0, 0.0) for key, n in lesions.items()]
+                + [("day", key, n, day_timed[key], day_ms[key]) for key, n in days.items()]
+            )
+            conn.executemany(
+                "INSERT INTO prediction_rollups (kind, key, count, timed, total_ms) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, key) DO UPDATE SET count = count + excluded.count, "
+                "timed = timed + excluded.timed, total_ms = total_ms + excluded.total_ms",
+                rollups,
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _flusher(self) -> None:
+        while True:
+            try:
+                await asyncio.sleep(PREDICTION_FLUSH_INTERVAL)
+                # Drain full batches back to back, then wait for the next interval
+                while await asyncio.to_thread(self.flush) == PREDICTION_BATCH_SIZE:
+                    pass
+            except asyncio.CancelledError:
+                break
+
+    def start(self) -> None:
+        """Start the flusher on the running event loop (call from app startup)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Write out whatever is still buffered before the worker exits
+        while await asyncio.to_thread(self.flush):
+            pass
+
+    # --------- Dashboard queries ---------
+    def history(self, patient_id: Optional[str] = None, study_id: Optional[str] = None,
+                before: Optional[Tuple[float, str]] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Newest-first predictions for a patient and/or study.
+
+        ``before`` is the (created_at, id) of the last item already seen; ties on created_at are
+        broken by id so rows sharing a timestamp are neither skipped nor repeated.
+        """
+        if not patient_id and not study_id:
+            raise ValueError("patient_id or study_id is required")
+        clauses, params = [], []
+        if patient_id:
+            clauses.append("patient_id = ?")
+            params.append(patient_id)
+        if study_id:
+            clauses.append("study_id = ?")
+            params.append(study_id)
+        if before is not None:
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend((before[0], before[0], before[1]))
+        rows = self._conn().execute(
+            f"SELECT * FROM predictions WHERE {' AND '.join(clauses)} ORDER BY created_at DESC, id DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        return [{k: row[k] for k in _COLUMNS if k != "day"} for row in rows]
+
+    def summary(self, days: int = 30) -> Dict[str, Any]:
+        """Precomputed aggregates: stage distribution, lesion class counts and daily volume."""
+        rows = self._conn().execute("SELECT kind, key, count, timed, total_ms FROM prediction_rollups").fetchall()
+        since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        stages = {r["key"]: r["count"] for r in rows if r["kind"] == "stage"}
+        lesions = {r["key"]: r["count"] for r in rows if r["kind"] == "lesion"}
+        daily = sorted(
+            ({"day": r["key"], "count": r["count"], "avg_inference_ms": r["total_ms"] / r["timed"] if r["timed"] else None}
+             for r in rows if r["kind"] == "day" and r["key"] >= since),
+            key=lambda d: d["day"],
+        )
+        return {
+            "total": sum(stages.values()),
+            "fibrosis_stages": stages,
+            "lesion_classes": lesions,
+            "daily": daily,
+            "pending": len(self._pending),
+        }
+
+
+# Global prediction history instance
+prediction_history = PredictionHistory(PREDICTION_DB_PATH)
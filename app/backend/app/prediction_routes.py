@@ -0,0 +1,45 @@
+"""
+Prediction history API for the SmartLiva dashboard and reports pages
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from .prediction_history import prediction_history
+
+router = APIRouter(prefix="/api/predictions", tags=["Predictions"])
+
+def _parse_cursor(cursor: str) -> tuple:
+    # "<created_at>_<id>"; repr(float) never contains "_"
+    created_at, _, record_id = cursor.partition("_")
+    try:
+        return float(created_at), record_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("")
+async def list_predictions(
+    patient_id: Optional[str] = None,
+    study_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """
+    Newest-first prediction history for one patient and/or study; pass ``next_cursor`` as ``cursor`` for the next page
+    """
+    if not patient_id and not study_id:
+        raise HTTPException(status_code=400, detail="patient_id or study_id is required")
+    before = _parse_cursor(cursor) if cursor else None
+    items = prediction_history.history(patient_id, study_id, before, limit)
+    return {
+        "items": items,
+        "next_cursor": f"{items[-1]['created_at']!r}_{items[-1]['id']}" if len(items) == limit else None,
+    }
+
+@router.get("/summary")
+async def prediction_summary(days: int = Query(30, ge=1, le=366)):
+    """
+    Dashboard aggregates (stage distribution, lesion class counts, daily volume) from the rollup table
+    """
+    return prediction_history.summary(days)
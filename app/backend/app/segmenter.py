@@ -0,0 +1,93 @@
+"""
+Thai-aware sentence segmentation for SmartLiva translation
+
+Thai writes no sentence punctuation; a space between two Thai words usually
+closes a sentence or clause, except before connectives that continue it.
+English uses terminal punctuation followed by whitespace, minus common
+clinical abbreviations. Line breaks always end a segment.
+
+``split_sentences`` returns (sentence, separator) pairs whose concatenation
+reproduces the input exactly, so translated sentences can be reassembled
+with the original spacing and line structure.
+"""
+
+import re
+from typing import List, Tuple
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Words that continue the current Thai sentence rather than start a new one
+THAI_CONNECTIVES = (
+    "และ", "หรือ", "แต่", "ซึ่ง", "ที่", "โดย", "เพื่อ", "เนื่องจาก", "จึง", "ก็",
+    "หาก", "ถ้า", "ว่า", "เช่น", "คือ", "รวมถึง", "ได้แก่", "ตลอดจน", "ส่วน", "กับ",
+)
+
+# Abbreviations whose trailing period does not end a sentence
+ABBREVIATIONS = {
+    "dr", "mr", "mrs", "ms", "prof", "vs", "e.g", "i.e", "etc", "approx", "no",
+    "fig", "ref", "st", "cf", "al", "min", "max",
+}
+
+MIN_SEGMENT_CHARS = 12
+# Longest abbreviation worth looking back for before a period
+_MAX_ABBREVIATION_CHARS = max(map(len, ABBREVIATIONS))
+
+
+def _is_thai(char: str) -> bool:
+    return "ก" <= char <= "๛"
+
+
+def _is_boundary(text: str, start: int, end: int) -> bool:
+    """Decide whether the whitespace run text[start:end] ends a sentence.
+
+    Only looks at characters next to the run, so splitting stays linear in the text length.
+    """
+    if "\n" in text[start:end]:
+        return True
+    if start == 0 or end == len(text):
+        return False
+    last = text[start - 1]
+    if last in ".!?":
+        if last == ".":
+            # A word longer than the window is not an abbreviation and not one letter either
+            window = text[max(0, start - _MAX_ABBREVIATION_CHARS - 2):start]
+            word = window.rsplit(None, 1)[-1].rstrip(".").lower()
+            if word in ABBREVIATIONS or len(word) == 1:
+                return False
+        return True
+    if _is_thai(last) and _is_thai(text[end]):
+        return not text.startswith(THAI_CONNECTIVES, end)
+    return False
+
+
+def split_sentences(text: str, min_chars: int = MIN_SEGMENT_CHARS) -> List[Tuple[str, str]]:
+    """Split text into (sentence, separator) pairs; ``"".join(s + sep)`` == text.
+
+    Fragments shorter than ``min_chars`` are merged into the following
+    sentence (same line only) to avoid many tiny upstream requests.
+    """
+    stripped = text.lstrip()
+    segments: List[Tuple[str, str]] = []
+    if len(stripped) != len(text):
+        segments.append(("", text[:len(text) - len(stripped)]))
+    offset = len(text) - len(stripped)
+
+    sentence_start = offset
+    for match in _WHITESPACE_RE.finditer(text, offset):
+        start, end = match.span()
+        if end == len(text):
+            break
+        if not _is_boundary(text, start, end):
+            continue
+        sentence = text[sentence_start:start]
+        separator = text[start:end]
+        if len(sentence) < min_chars and "\n" not in separator:
+            continue  # keep accumulating into the next sentence
+        segments.append((sentence, separator))
+        sentence_start = end
+
+    tail = text[sentence_start:]
+    content = tail.rstrip()
+    if content or tail:
+        segments.append((content, tail[len(content):]))
+    return segments
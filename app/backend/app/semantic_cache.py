@@ -0,0 +1,444 @@
+"""
+Semantic near-duplicate cache for single-turn chat questions
+
+Paraphrased questions ("is fatty liver dangerous" / "how dangerous is fatty
+liver disease") miss the exact-match reply cache. This cache embeds each
+question with a CPU-only hashing vectorizer and answers from the nearest
+stored question when cosine similarity clears a per-language threshold.
+
+- Vectorizer: word unigrams (short/numeric tokens such as "b" in
+  "hepatitis b" or "f2" weighted up) plus character n-grams, signed-hashed
+  into a fixed number of dimensions with a process-stable hash.
+- Index: int8-quantised vectors (``dim`` bytes per entry, plus 12 bytes of
+  signature tag and timestamp) in one growable matrix per language. Small
+  indexes are scanned exhaustively; larger ones get an inverted-file (IVF)
+  coarse quantiser, retrained in a background thread each time the index
+  doubles, so a lookup scores only a few thousand candidates.
+- Guard: similarity alone cannot tell "hepatitis B" from "hepatitis C" or
+  "dangerous" from "not dangerous". Every question carries a signature of
+  its distinguishing tokens (hepatitis letter, stage, numbers, negation,
+  population such as children or pregnancy), and a cached reply is only
+  returned when the signatures are identical, in Thai as in English. The
+  signature is filtered on before scoring, so mismatches cost nothing.
+- Replies live in a SQLite file on local disk (``data/``). A background
+  thread per worker tails it, so entries added by one worker are found by
+  all, and periodically purges expired rows and rebuilds the in-memory
+  index without them. Lookups never scan the table on the event loop.
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from .shared_state import LocalConnection, store
+
+try:
+    import numpy as np
+    _numpy_available = True
+except Exception:
+    _numpy_available = False
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", os.path.join(BACKEND_DIR, "data", "semantic_cache.db"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", 256))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 7 * 24 * 3600))
+SEMANTIC_CACHE_THRESHOLDS = {
+    "en": float(os.getenv("SEMANTIC_CACHE_THRESHOLD_EN", 0.90)),
+    "th": float(os.getenv("SEMANTIC_CACHE_THRESHOLD_TH", 0.88)),
+}
+SEMANTIC_CACHE_PURGE_INTERVAL = float(os.getenv("SEMANTIC_CACHE_PURGE_INTERVAL", 600))
+# Nearest same-signature neighbours tried (a row may already be purged by another worker)
+SEMANTIC_CACHE_TOP_K = 8
+
+_THAI_RE = re.compile(r"[฀-๿]")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+# Thai question particles: "อันตรายไหม" and "อันตรายหรือไม่" ask the same thing
+_THAI_PARTICLES_RE = re.compile(r"หรือไม่|หรือเปล่า|ไหม|มั้ย|ไหมคะ|ไหมครับ|คะ|ครับ|บ้าง")
+
+# Distinguishing tokens; questions that differ in any of them need different answers
+_DISEASE_LETTER_RE = re.compile(r"\bhep(?:atitis)?\s*([a-e])\b|\bh([a-e])v\b")
+_THAI_DISEASE_LETTER_RE = re.compile(r"ตับอักเสบ\s*(เอ|บี|ซี|ดี|อี|[a-e](?![a-z]))")
+_THAI_LETTERS = {"เอ": "a", "บี": "b", "ซี": "c", "ดี": "d", "อี": "e"}
+_STAGE_RE = re.compile(r"\b([fsa])\s?([0-4])\b")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_NEGATION_RE = re.compile(r"\b(?:not|no|never|without|cannot|nor)\b|n['’]t\b")
+_THAI_NEGATIONS = ("ไม่", "ห้าม", "ปราศจาก", "มิได้")
+POPULATIONS = {
+    "child": ("child", "children", "kid", "kids", "pediatric", "paediatric", "infant", "infants",
+              "baby", "babies", "newborn", "newborns", "teen", "teenager", "teenagers", "adolescent",
+              "adolescents", "เด็ก", "ทารก", "วัยรุ่น"),
+    "pregnancy": ("pregnant", "pregnancy", "breastfeeding", "ตั้งครรภ์", "คนท้อง", "มีครรภ์", "ให้นมบุตร"),
+    "elderly": ("elderly", "older", "ผู้สูงอายุ", "คนแก่"),
+    "adult": ("adult", "adults", "ผู้ใหญ่"),
+}
+
+# Function words that carry no meaning for matching paraphrased questions
+_STOPWORDS = {
+    "a", "about", "an", "and", "are", "be", "can", "disease", "do", "does", "for",
+    "how", "i", "in", "is", "it", "me", "much", "my", "of", "please", "tell",
+    "the", "there", "to", "very", "what", "which", "with",
+}
+
+
+def detect_language(text: str) -> str:
+    return "th" if _THAI_RE.search(text) else "en"
+
+
+def question_signature(text: str) -> str:
+    """Canonical string of the tokens that must match exactly for a cached reply to apply."""
+    lowered = text.lower()
+    thai = _THAI_PARTICLES_RE.sub(" ", lowered)
+    words = set(_PUNCT_RE.sub(" ", lowered).split())
+    parts = set()
+    for match in _DISEASE_LETTER_RE.finditer(lowered):
+        parts.add("hep:" + (match.group(1) or match.group(2)))
+    for match in _THAI_DISEASE_LETTER_RE.finditer(lowered):
+        parts.add("hep:" + _THAI_LETTERS.get(match.group(1), match.group(1)))
+    for match in _STAGE_RE.finditer(lowered):
+        parts.add("stage:" + match.group(1) + match.group(2))
+    for number in _NUMBER_RE.findall(lowered):
+        parts.add("num:" + number)
+    if _NEGATION_RE.search(lowered) or any(neg in thai for neg in _THAI_NEGATIONS):
+        parts.add("neg")
+    for group, terms in POPULATIONS.items():
+        if any(term in words if term.isascii() else term in lowered for term in terms):
+            parts.add("pop:" + group)
+    return "|".join(sorted(parts))
+
+
+class HashingVectorizer:
+    """Stateless text -> unit vector embedding (no vocabulary, no training)."""
+
+    def __init__(self, dim: int = SEMANTIC_CACHE_DIM, word_weight: float = 3.0):
+        self.dim = dim
+        self.word_weight = word_weight
+
+    def features(self, text: str) -> Dict[str, float]:
+        feats: Dict[str, float] = {}
+
+        def add(key: str, weight: float) -> None:
+            feats[key] = feats.get(key, 0.0) + weight
+
+        for token in _PUNCT_RE.sub(" ", _THAI_PARTICLES_RE.sub(" ", text.lower())).split():
+            padded = f"<{token}>"
+            if _THAI_RE.search(token):
+                # Thai has no word spacing; character bigrams/trigrams stand in for words
+                for n in (2, 3):
+                    for i in range(len(padded) - n + 1):
+                        add("t" + padded[i:i + n], 1.0)
+                continue
+            if token in _STOPWORDS:
+                continue
+            distinctive = len(token) <= 2 or any(c.isdigit() for c in token)
+            add("w:" + token, self.word_weight * (3 if distinctive else 1))
+            for n in (3, 4):
+                for i in range(len(padded) - n + 1):
+                    add(padded[i:i + n], 1.0)
+        return feats
+
+    def transform(self, text: str) -> Optional["np.ndarray"]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for key, weight in self.features(text).items():
+            h = zlib.crc32(key.encode("utf-8"))
+            vec[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            return None
+        return vec / norm
+
+
+class VectorIndex:
+    """Nearest-neighbour index over int8-quantised unit vectors.
+
+    Every row also carries an integer tag and a creation time, kept in arrays
+    parallel to the ids, so searches can filter on them without per-entry
+    Python objects. Only the filtered candidates are converted to float32.
+    """
+
+    IVF_MIN_ENTRIES = 2048   # exhaustive scan below this size
+    IVF_MAX_LISTS = 1024
+    NPROBE = 6
+    RETRAIN_GROWTH = 2       # retrain once the index has grown this much since the last training
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._vecs = np.zeros((1024, dim), dtype=np.int8)
+        self._ids = np.zeros(1024, dtype=np.int64)
+        self._tags = np.zeros(1024, dtype=np.int32)
+        self._created = np.zeros(1024, dtype=np.float64)
+        self._count = 0
+        self._lock = threading.Lock()
+        # IVF state: centroids (nlist, dim) float32 and one row list per centroid
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[array] = []
+        self._trained_at = 0
+        self._training = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    @staticmethod
+    def _quantize(vec: "np.ndarray") -> "np.ndarray":
+        return np.clip(np.rint(vec * 127.0), -127, 127).astype(np.int8)
+
+    def count_before(self, cutoff: float) -> int:
+        """Number of rows created at or before ``cutoff``."""
+        return int(np.count_nonzero(self._created[:self._count] <= cutoff))
+
+    def add(self, entry_id: int, vec: "np.ndarray", tag: int = 0, created_at: float = 0.0) -> None:
+        with self._lock:
+            if self._count == len(self._ids):
+                self._vecs = np.concatenate([self._vecs, np.zeros_like(self._vecs)])
+                self._ids = np.concatenate([self._ids, np.zeros_like(self._ids)])
+                self._tags = np.concatenate([self._tags, np.zeros_like(self._tags)])
+                self._created = np.concatenate([self._created, np.zeros_like(self._created)])
+            row = self._count
+            self._vecs[row] = self._quantize(vec)
+            self._ids[row] = entry_id
+            self._tags[row] = tag
+            self._created[row] = created_at
+            self._count += 1
+            if self._centroids is not None:
+                self._lists[int(np.argmax(self._centroids @ vec))].append(row)
+        self._maybe_train()
+
+    def search(self, vec: "np.ndarray", k: int = 1, tag: Optional[int] = None,
+               since: Optional[float] = None) -> List[Tuple[int, float]]:
+        """
+        Return up to ``k`` (entry_id, cosine similarity) pairs, nearest first.
+
+        Only rows with the given ``tag`` and created after ``since`` are considered.
+        """
+        with self._lock:
+            count = self._count
+            if count == 0:
+                return []
+            rows = None
+            if self._centroids is not None:
+                probes = np.argpartition(self._centroids @ vec, -self.NPROBE)[-self.NPROBE:]
+                parts = [np.frombuffer(self._lists[p], dtype=np.int32) for p in probes if len(self._lists[p])]
+                if not parts:
+                    return []
+                rows = np.concatenate(parts)
+            keep = None
+            if tag is not None:
+                keep = (self._tags[:count] if rows is None else self._tags[rows]) == tag
+            if since is not None:
+                fresh = (self._created[:count] if rows is None else self._created[rows]) > since
+                keep = fresh if keep is None else keep & fresh
+            if keep is not None:
+                rows = np.flatnonzero(keep) if rows is None else rows[keep]
+                if len(rows) == 0:
+                    return []
+            candidates = self._vecs[:count] if rows is None else self._vecs[rows]
+            ids = self._ids[:count] if rows is None else self._ids[rows]
+            scores = candidates.astype(np.float32) @ vec
+            k = min(k, len(scores))
+            top = np.argpartition(scores, -k)[-k:]
+            top = top[np.argsort(scores[top])[::-1]]
+            return [(int(ids[i]), float(scores[i]) / 127.0) for i in top]
+
+    def _maybe_train(self) -> None:
+        # (Re)train at each doubling so list sizes stay near count / nlist; the cost is amortised over inserts
+        if self._training or self._count < self.IVF_MIN_ENTRIES:
+            return
+        if self._trained_at and self._count < self.RETRAIN_GROWTH * self._trained_at:
+            return
+        self._training = True
+        threading.Thread(target=self._train, daemon=True).start()
+
+    def _train(self) -> None:
+        try:
+            with self._lock:
+                count = self._count
+                data = self._vecs[:count].astype(np.float32) / 127.0
+            nlist = min(self.IVF_MAX_LISTS, int(4 * math.sqrt(count)))
+            rng = np.random.default_rng(0)
+            sample = data[rng.choice(count, size=min(count, 32 * nlist), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+            for _ in range(8):  # spherical k-means
+                assign = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, sample)
+                norms = np.linalg.norm(sums, axis=1)
+                filled = norms > 0  # empty clusters keep their previous centroid
+                centroids[filled] = sums[filled] / norms[filled, None]
+            assign = np.concatenate([
+                np.argmax(data[start:start + 16384] @ centroids.T, axis=1)
+                for start in range(0, count, 16384)
+            ])
+            order = np.argsort(assign, kind="stable").astype(np.int32)
+            bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+            lists = [array("i", order[bounds[c]:bounds[c + 1]].tobytes()) for c in range(nlist)]
+            with self._lock:
+                # Rows added while training was running
+                for row in range(count, self._count):
+                    vec = self._vecs[row].astype(np.float32) / 127.0
+                    lists[int(np.argmax(centroids @ vec))].append(row)
+                self._centroids = centroids
+                self._lists = lists
+                self._trained_at = count
+            logger.info(f"Semantic cache index trained: {count} entries, {nlist} lists")
+        except Exception as e:
+            logger.error(f"Semantic cache index training failed: {e}")
+        finally:
+            self._training = False
+
+
+def _setup(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS entries ("
+        "id INTEGER PRIMARY KEY, language TEXT NOT NULL, vector BLOB NOT NULL, "
+        "question TEXT NOT NULL, reply TEXT NOT NULL, usage_tokens INTEGER, created_at REAL NOT NULL, "
+        "signature TEXT NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS entries_created ON entries (created_at)")
+
+
+class SemanticChatCache:
+    """Per-language nearest-neighbour reply cache shared between workers."""
+
+    SYNC_INTERVAL = 1.0
+
+    def __init__(self, path: str, dim: int = SEMANTIC_CACHE_DIM, ttl: float = SEMANTIC_CACHE_TTL,
+                 thresholds: Optional[Dict[str, float]] = None,
+                 purge_interval: float = SEMANTIC_CACHE_PURGE_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.thresholds = thresholds or SEMANTIC_CACHE_THRESHOLDS
+        self.purge_interval = purge_interval
+        self.vectorizer = HashingVectorizer(dim)
+        self._indexes: Dict[str, VectorIndex] = {}
+        # question signature -> small integer tag stored per row in the indexes
+        self._signature_codes: Dict[str, int] = {}
+        self._last_id = 0
+        self._conn = LocalConnection(path, _setup)
+        self._sync_lock = threading.Lock()
+        self._worker_pid: Optional[int] = None
+
+    # --------- Background sync (one thread per worker process) ---------
+    def _ensure_worker(self) -> None:
+        if self._worker_pid == os.getpid():
+            return
+        with self._sync_lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+        threading.Thread(target=self._run, name="semantic-cache", daemon=True).start()
+
+    def _run(self) -> None:
+        next_purge = time.monotonic() + self.purge_interval
+        while True:
+            try:
+                self.sync()
+                if time.monotonic() >= next_purge:
+                    self.compact()
+                    next_purge = time.monotonic() + self.purge_interval
+            except sqlite3.Error as e:
+                logger.warning(f"Semantic cache sync failed: {e}")
+            except Exception as e:
+                logger.error(f"Semantic cache sync error: {e}")
+            time.sleep(self.SYNC_INTERVAL)
+
+    def _load(self, indexes: Dict[str, VectorIndex], codes: Dict[str, int], after_id: int) -> int:
+        rows = self._conn().execute(
+            "SELECT id, language, vector, signature, created_at FROM entries "
+            "WHERE id > ? AND created_at > ? ORDER BY id",
+            (after_id, time.time() - self.ttl),
+        ).fetchall()
+        for entry_id, language, blob, signature, created_at in rows:
+            if language not in indexes:
+                indexes[language] = VectorIndex(self.vectorizer.dim)
+            code = codes.setdefault(signature, len(codes))
+            indexes[language].add(entry_id, np.frombuffer(blob, dtype=np.float32), code, created_at)
+            after_id = entry_id
+        return after_id
+
+    def sync(self) -> None:
+        """Pull entries written by any worker since the last sync."""
+        with self._sync_lock:
+            self._last_id = self._load(self._indexes, self._signature_codes, self._last_id)
+
+    def compact(self) -> None:
+        """Delete expired rows and rebuild the indexes from the live ones."""
+        self.purge_expired()
+        with self._sync_lock:
+            cutoff = time.time() - self.ttl
+            expired = sum(index.count_before(cutoff) for index in self._indexes.values())
+            if not expired:
+                return
+            indexes: Dict[str, VectorIndex] = {}
+            codes: Dict[str, int] = {}
+            last_id = self._load(indexes, codes, 0)
+            # Swap whole objects so concurrent lookups see either the old or the new index
+            self._indexes, self._signature_codes, self._last_id = indexes, codes, last_id
+        logger.info(f"Semantic cache compacted: dropped {expired} expired entries")
+
+    def purge_expired(self) -> int:
+        try:
+            cur = self._conn().execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl,))
+        except sqlite3.Error as e:
+            logger.warning(f"Semantic cache purge failed: {e}")
+            return 0
+        return cur.rowcount
+
+    # --------- Request path ---------
+    def lookup(self, question: str, language: Optional[str] = None) -> Optional[Dict]:
+        self._ensure_worker()
+        language = language or detect_language(question)
+        vec = self.vectorizer.transform(question)
+        index = self._indexes.get(language)
+        if vec is None or index is None:
+            return None
+        # Only entries with exactly the same distinguishing tokens are candidates
+        code = self._signature_codes.get(question_signature(question))
+        threshold = self.thresholds.get(language, 0.90)
+        hits = [] if code is None else index.search(vec, SEMANTIC_CACHE_TOP_K, tag=code, since=time.time() - self.ttl)
+        for entry_id, similarity in hits:
+            if similarity < threshold:
+                break
+            try:
+                row = self._conn().execute(
+                    "SELECT reply, usage_tokens FROM entries WHERE id = ?", (entry_id,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Semantic cache read failed: {e}")
+                return None
+            if row is None:
+                continue
+            store.incr("semantic_cache.hit")
+            store.observe("semantic_cache.similarity", similarity)
+            return {"reply": row[0], "usage_tokens": row[1]}
+        store.incr("semantic_cache.miss")
+        return None
+
+    def add(self, question: str, reply: str, usage_tokens: Optional[int], language: Optional[str] = None) -> None:
+        self._ensure_worker()
+        language = language or detect_language(question)
+        vec = self.vectorizer.transform(question)
+        if vec is None:
+            return
+        try:
+            self._conn().execute(
+                "INSERT INTO entries (language, vector, question, reply, usage_tokens, created_at, signature) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (language, vec.astype(np.float32).tobytes(), question, reply, usage_tokens, time.time(),
+                 question_signature(question)),
+            )
+        except sqlite3.Error as e:
+            # The reply was already produced; a failed cache write must not fail the request
+            logger.warning(f"Semantic cache write failed: {e}")
+
+
+# Global semantic cache instance (None when numpy is unavailable)
+semantic_cache = SemanticChatCache(SEMANTIC_CACHE_PATH) if _numpy_available else None
@@ -0,0 +1,109 @@
+"""
+Production launcher for SmartLiva API
+
+Runs the FastAPI app under gunicorn with uvicorn workers:
+- worker count follows the CPU cores available to the process
+- the app is imported once in the master and forked (copy-on-write pages)
+- SIGTERM drains in-flight requests for ``GRACEFUL_TIMEOUT`` seconds
+
+Usage: ``python -m app.server`` (see Procfile)
+"""
+
+import gc
+import importlib
+import math
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from gunicorn.app.base import BaseApplication
+
+from .shared_state import store
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    """CPU quota from the cgroup (how Docker/Railway cap CPU), in cores; None if unlimited."""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cores() -> int:
+    """CPU cores this process may use: CPU affinity, capped by the cgroup CPU quota."""
+    if hasattr(os, "sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = multiprocessing.cpu_count()
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cores = min(cores, math.ceil(limit))
+    return max(1, cores)
+
+
+def _on_starting(server) -> None:
+    # Counters from a previous run would skew gauges such as queue depth.
+    # Workers also purge expired cache rows periodically (see shared_state).
+    store.reset_metrics()
+    store.purge_expired()
+
+
+def _when_ready(server) -> None:
+    # Move everything imported by the preloaded app into the permanent
+    # generation so the GC does not touch (and un-share) those pages in workers
+    gc.freeze()
+
+
+def build_options() -> Dict:
+    port = int(os.environ.get("PORT", 8000))
+    return {
+        "bind": f"0.0.0.0:{port}",
+        "workers": int(os.environ.get("WEB_CONCURRENCY", available_cores())),
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "graceful_timeout": int(os.environ.get("GRACEFUL_TIMEOUT", 30)),
+        "timeout": int(os.environ.get("WORKER_TIMEOUT", 120)),
+        "keepalive": int(os.environ.get("KEEPALIVE", 5)),
+        "max_requests": int(os.environ.get("MAX_REQUESTS", 0)),
+        "max_requests_jitter": int(os.environ.get("MAX_REQUESTS_JITTER", 0)),
+        "accesslog": "-",
+        "on_starting": _on_starting,
+        "when_ready": _when_ready,
+    }
+
+
+class SmartLivaServer(BaseApplication):
+    def __init__(self, app_path: str, options: Dict):
+        self.app_path = app_path
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        module_name, attr = self.app_path.split(":")
+        return getattr(importlib.import_module(module_name), attr)
+
+
+def main():
+    app_path = os.environ.get("SMARTLIVA_APP", "app.main:app")
+    SmartLivaServer(app_path, build_options()).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Process-shared cache and metrics store for SmartLiva API workers
+
+All gunicorn workers started by ``app.server`` open the same SQLite file
+(WAL mode, under ``data/`` next to the job and prediction databases), so a
+reply cached by one worker is a hit for every other worker and counters add
+up across the pool. The file lives on disk rather than ``/dev/shm`` (64 MB
+in a default Docker container); hot pages stay in the page cache anyway.
+
+Metrics are aggregated in process memory and written in one transaction
+every ``METRICS_FLUSH_INTERVAL`` seconds by a background thread, so request
+handlers never wait on the shared writer lock to bump a counter. The same
+thread purges expired cache entries every ``CACHE_PURGE_INTERVAL`` seconds
+and then trims the cache to ``CACHE_MAX_ENTRIES``, dropping the entries
+closest to expiry first.
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+STATE_PATH = Path(os.getenv("SMARTLIVA_STATE_PATH", str(BACKEND_DIR / "data" / "smartliva_state.db")))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 2.0))
+CACHE_PURGE_INTERVAL = float(os.getenv("CACHE_PURGE_INTERVAL", 300.0))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 200000))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at);
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class LocalConnection:
+    """Lazily opened SQLite connection, one per process and thread.
+
+    Calling the instance returns the connection for the current thread,
+    opening it on first use and again after a fork, so a module-level
+    instance imported by the preloaded master never leaks a connection into
+    forked workers. Connections are in autocommit mode with WAL enabled;
+    ``setup`` runs once on each new connection (schema and migrations).
+    """
+
+    def __init__(self, path: Union[str, Path], setup: Optional[Callable[[sqlite3.Connection], None]] = None,
+                 timeout: float = 5.0, synchronous: str = "NORMAL", row_factory: Optional[Callable] = None):
+        self.path = Path(path)
+        self.setup = setup
+        self.timeout = timeout
+        self.synchronous = synchronous
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def __call__(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=self.timeout, isolation_level=None)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            if self.setup is not None:
+                self.setup(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class SharedStore:
+    """SQLite-backed key/value cache and counters shared between processes.
+
+    Connections are opened lazily per process and per thread (see
+    ``LocalConnection``), so the store can be imported by the preloaded
+    master without leaking a connection into forked workers.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._conn = LocalConnection(self.path, lambda conn: conn.executescript(_SCHEMA))
+        # name -> [value, count] not yet written; owned by the current process
+        self._pending: Dict[str, list] = {}
+        self._pending_lock = threading.Lock()
+        self._maintenance_pid: Optional[int] = None
+
+    # --------- Cache ---------
+    def cache_get(self, namespace: str, key: str) -> Optional[Any]:
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            return None
+        if row is None or row[1] < time.time():
+            # Expired rows are left for the periodic purge; no write on the request path
+            self.incr(f"cache.{namespace}.miss")
+            return None
+        self.incr(f"cache.{namespace}.hit")
+        return json.loads(row[0])
+
+    def cache_set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), time.time() + ttl),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def cache_delete(self, namespace: str, key: str) -> None:
+        try:
+            self._conn().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache delete failed: {e}")
+
+    def purge_expired(self, max_entries: int = CACHE_MAX_ENTRIES) -> int:
+        """Delete expired entries, then the soonest-to-expire ones above ``max_entries``."""
+        try:
+            conn = self._conn()
+            purged = conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),)).rowcount
+            excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - max_entries
+            if excess > 0:
+                purged += conn.execute(
+                    "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY expires_at LIMIT ?)",
+                    (excess,),
+                ).rowcount
+                self.incr("cache.trimmed", excess)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache purge failed: {e}")
+            return 0
+        return purged
+
+    # --------- Metrics ---------
+    def incr(self, name: str, amount: float = 1.0) -> None:
+        """Add ``amount`` to a counter (use a negative amount for gauges)."""
+        self._ensure_maintenance()
+        with self._pending_lock:
+            entry = self._pending.get(name)
+            if entry is None:
+                self._pending[name] = [amount, 1]
+            else:
+                entry[0] += amount
+                entry[1] += 1
+
+    def flush_metrics(self) -> None:
+        """Write this process's aggregated metrics to the shared file in one transaction."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO metrics (name, value, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value, count = count + excluded.count",
+                    [(name, value, count) for name, (value, count) in pending.items()],
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared metric flush failed: {e}")
+            # Keep the samples for the next flush
+            with self._pending_lock:
+                for name, (value, count) in pending.items():
+                    entry = self._pending.setdefault(name, [0.0, 0])
+                    entry[0] += value
+                    entry[1] += count
+
+    def _ensure_maintenance(self) -> None:
+        # One daemon thread per process, started lazily so each forked worker gets its own
+        if self._maintenance_pid == os.getpid():
+            return
+        with self._pending_lock:
+            if self._maintenance_pid == os.getpid():
+                return
+            self._maintenance_pid = os.getpid()
+            self._pending = {}  # samples inherited from the parent are the parent's to flush
+        threading.Thread(target=self._maintenance, name="shared-store", daemon=True).start()
+        atexit.register(self.flush_metrics)
+
+    def _maintenance(self) -> None:
+        next_purge = time.monotonic() + CACHE_PURGE_INTERVAL
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            self.flush_metrics()
+            if time.monotonic() >= next_purge:
+                self.purge_expired()
+                next_purge = time.monotonic() + CACHE_PURGE_INTERVAL
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one sample; ``metrics()`` reports its count, sum and mean."""
+        self.incr(name, value)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        # Other workers' samples may lag by up to METRICS_FLUSH_INTERVAL
+        self.flush_metrics()
+        rows = self._conn().execute("SELECT name, value, count FROM metrics ORDER BY name").fetchall()
+        return {
+            name: {"value": value, "count": count, "mean": (value / count) if count else 0.0}
+            for name, value, count in rows
+        }
+
+    def reset_metrics(self) -> None:
+        with self._pending_lock:
+            self._pending = {}
+        self._conn().execute("DELETE FROM metrics")
+
+
+# Global shared store instance
+store = SharedStore(STATE_PATH)
@@ -0,0 +1,100 @@
+"""
+Shared medical terminology tables for SmartLiva translation
+
+Kept free of API-client imports so build steps and request handlers can use
+the tables without constructing the translator.
+"""
+
+import re
+from typing import Dict
+
+SUPPORTED_LANGUAGES = ["th", "en"]
+
+# Medical terminology mapping for accuracy
+MEDICAL_TERMS = {
+    "en": {
+        "fibrosis": "fibrosis",
+        "cirrhosis": "cirrhosis", 
+        "hepatocellular carcinoma": "hepatocellular carcinoma",
+        "liver stiffness": "liver stiffness",
+        "ultrasound": "ultrasound",
+        "elastography": "elastography",
+        "kPa": "kPa"
+    },
+    "th": {
+        "fibrosis": "เส้นใยแข็งตับ",
+        "cirrhosis": "ตับแข็ง",
+        "hepatocellular carcinoma": "มะเร็งเซลล์ตับ", 
+        "liver stiffness": "ความแข็งของตับ",
+        "ultrasound": "อัลตราซาวด์",
+        "elastography": "อีลาสโตกราฟี",
+        "kPa": "กิโลปาสกาล"
+    }
+}
+
+LANGUAGE_OPTIONS = [
+    {"code": "th", "name": "ไทย", "flag": "🇹🇭"},
+    {"code": "en", "name": "English", "flag": "🇺🇸"}
+]
+
+LANGUAGE_NAMES = {"th": "Thai", "en": "English"}
+
+# Table entries that are measurement units rather than vocabulary
+UNIT_TERMS = {"kPa"}
+
+# Non-canonical spellings seen in generated answers, mapped to the table's term
+TERM_VARIANTS = {
+    "th": {
+        "ไฟโบรซิส": "เส้นใยแข็งตับ",
+        "อัลตร้าซาวด์": "อัลตราซาวด์",
+        "อัลตราซาวนด์": "อัลตราซาวด์",
+        "อิลาสโตกราฟี": "อีลาสโตกราฟี",
+        "อีลาสโตกราฟฟี": "อีลาสโตกราฟี",
+    },
+    "en": {},
+}
+
+
+def glossary_prompt(target_language: str) -> str:
+    """Glossary lines for a generation prompt: English term -> required target term."""
+    terms = MEDICAL_TERMS.get(target_language, {})
+    # Units stay as written in either language
+    return "\n".join(f"- {source} = {target}" for source, target in terms.items()
+                     if source != target and source not in UNIT_TERMS)
+
+
+def _term_pattern(term: str) -> "re.Pattern":
+    # Leave a term alone when it is the parenthesised gloss after its translation, e.g. "ตับแข็ง (cirrhosis)"
+    # Thai is written without spaces, so word boundaries only apply to Latin terms
+    if term.isascii():
+        return re.compile(r"(?<![(\w-])" + re.escape(term) + r"(?![\w)-])", re.IGNORECASE)
+    return re.compile(r"(?<!\()" + re.escape(term) + r"(?!\))")
+
+
+_PATTERNS: Dict[str, list] = {}
+
+
+def enforce_terminology(text: str, target_language: str) -> str:
+    """Post-pass for answers generated in ``target_language``: canonical glossary terms only.
+
+    Variant spellings are normalised, and bare English terms left in a
+    non-English answer are replaced with the table's term. Units such as kPa
+    are kept as written.
+    """
+    if target_language not in _PATTERNS:
+        patterns = [(_term_pattern(v), c) for v, c in TERM_VARIANTS.get(target_language, {}).items()]
+        if target_language != "en":
+            patterns += [
+                (_term_pattern(source), target)
+                for source, target in MEDICAL_TERMS.get(target_language, {}).items()
+                if source != target and source not in UNIT_TERMS
+            ]
+        else:
+            # English answers: Thai table terms that slipped through go back to English
+            patterns += [(_term_pattern(th), en) for en, th in MEDICAL_TERMS["th"].items() if en not in UNIT_TERMS]
+        # Longest first so "liver stiffness" wins over shorter overlapping terms
+        patterns.sort(key=lambda p: len(p[0].pattern), reverse=True)
+        _PATTERNS[target_language] = patterns
+    for pattern, replacement in _PATTERNS[target_language]:
+        text = pattern.sub(replacement, text)
+    return text
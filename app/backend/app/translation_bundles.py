@@ -0,0 +1,265 @@
+"""
+Precompiled interface translation bundles for SmartLiva
+
+Build step (run at image build, also done incrementally on first use):
+
+    python -m app.translation_bundles
+
+For every language the compiler combines the interface strings in
+``i18n/<lang>.json`` with the medical terminology table, serialises the
+result once, and writes identity, gzip and (when ``brotli`` is installed)
+brotli variants to ``build/i18n``. Each artifact is versioned by a content
+hash; every encoding gets its own strong ETag (``"<hash>"``,
+``"<hash>-gzip"``, ``"<hash>-br"``) since the bodies differ byte for byte.
+
+``i18n/<lang>.json`` is generated from the frontend ``src/i18n.ts`` with
+``npm run export-i18n`` (in ``app/frontend``); ``npm run build`` fails if the
+copies are out of date. The manifest records the source hash
+of every artifact so only languages whose strings changed are rebuilt.
+
+Workers rebuild incrementally while other workers may be reading, so every
+file is written to a temporary name and renamed into place, and superseded
+versions are only deleted by the offline build (another worker's manifest
+may still point at them).
+
+Serving is a dictionary lookup plus an ETag comparison, so steady-state
+interface loads do no translation or serialisation work.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+import logging
+
+from .terminology import LANGUAGE_OPTIONS, MEDICAL_TERMS, SUPPORTED_LANGUAGES
+
+try:
+    import brotli  # type: ignore
+    _brotli_available = True
+except Exception:
+    _brotli_available = False
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SOURCE_DIR = Path(os.getenv("I18N_SOURCE_DIR", str(BACKEND_DIR / "i18n")))
+BUILD_DIR = Path(os.getenv("I18N_BUILD_DIR", str(BACKEND_DIR / "build" / "i18n")))
+MANIFEST_NAME = "manifest.json"
+
+# Seconds between checks of the source strings for edits (0 disables)
+RELOAD_INTERVAL = float(os.getenv("I18N_RELOAD_INTERVAL", 30))
+
+# Content-Encodings in server preference order
+ENCODINGS = ["br", "gzip"]
+
+
+def _canonical_json(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # Readers see either the previous file or the complete new one, never a partial write
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+def collect_sources(source_dir: Path = SOURCE_DIR) -> Dict[str, dict]:
+    """Artifact name -> payload, built from the current source strings."""
+    sources: Dict[str, dict] = {"languages": {"success": True, "languages": LANGUAGE_OPTIONS}}
+    for language in SUPPORTED_LANGUAGES:
+        interface_path = source_dir / f"{language}.json"
+        interface = json.loads(interface_path.read_text(encoding="utf-8")) if interface_path.exists() else {}
+        medical_terms = MEDICAL_TERMS.get(language, {})
+        sources[f"medical-terms/{language}"] = {
+            "success": True,
+            "language": language,
+            "medical_terms": medical_terms,
+        }
+        sources[f"bundle/{language}"] = {
+            "language": language,
+            "interface": interface,
+            "medical_terms": medical_terms,
+        }
+    return sources
+
+
+class BundleCompiler:
+    def __init__(self, source_dir: Path = SOURCE_DIR, build_dir: Path = BUILD_DIR):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+
+    def _load_manifest(self) -> Dict:
+        path = self.build_dir / MANIFEST_NAME
+        if not path.exists():
+            return {"artifacts": {}}
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            return {"artifacts": {}}
+
+    def _is_current(self, entry: Optional[Dict], source_hash: str) -> bool:
+        if not entry or entry.get("source_hash") != source_hash:
+            return False
+        files = [entry["file"]] + list(entry.get("encodings", {}).values())
+        return all((self.build_dir / f).exists() for f in files)
+
+    def _compile(self, name: str, payload: dict) -> Dict:
+        version = _sha256(_canonical_json(payload))[:16]
+        body = _canonical_json({**payload, "version": version})
+        stem = f"{name.replace('/', '-')}.{version}.json"
+        _write_atomic(self.build_dir / stem, body)
+        encodings = {"gzip": stem + ".gz"}
+        _write_atomic(self.build_dir / encodings["gzip"], gzip.compress(body, compresslevel=9, mtime=0))
+        if _brotli_available:
+            encodings["br"] = stem + ".br"
+            _write_atomic(self.build_dir / encodings["br"], brotli.compress(body, quality=11))
+        return {"version": version, "etag": f'"{version}"', "file": stem, "encodings": encodings}
+
+    def build(self, prune: bool = False) -> Dict:
+        """
+        Rebuild artifacts whose sources changed; returns the manifest.
+
+        ``prune`` deletes files of superseded versions. Only the offline build passes it: a
+        running worker's manifest may still point at the old files.
+        """
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+        manifest = self._load_manifest()
+        old = manifest.get("artifacts", {})
+        artifacts = {}
+        for name, payload in collect_sources(self.source_dir).items():
+            source_hash = _sha256(_canonical_json(payload))
+            if self._is_current(old.get(name), source_hash):
+                artifacts[name] = old[name]
+                continue
+            entry = self._compile(name, payload)
+            entry["source_hash"] = source_hash
+            artifacts[name] = entry
+            logger.info(f"Compiled translation artifact {name} ({entry['version']})")
+
+        if prune:
+            keep = {MANIFEST_NAME}
+            for entry in artifacts.values():
+                keep.add(entry["file"])
+                keep.update(entry["encodings"].values())
+            for path in self.build_dir.iterdir():
+                if path.is_file() and path.name not in keep and not path.name.endswith(".tmp"):
+                    path.unlink(missing_ok=True)
+
+        manifest = {"artifacts": artifacts}
+        _write_atomic(self.build_dir / MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+        return manifest
+
+
+class CompiledArtifact:
+    def __init__(self, version: str, etag: str, variants: Dict[str, bytes]):
+        self.version = version
+        self.etag = etag
+        self.variants = variants  # content-encoding ("identity", "gzip", "br") -> bytes
+
+    def etag_for(self, encoding: str) -> str:
+        """Strong ETag of one encoded body (identity keeps the bare version tag)."""
+        if encoding == "identity":
+            return self.etag
+        return f'{self.etag[:-1]}-{encoding}"'
+
+
+class BundleStore:
+    """In-memory view of the compiled artifacts, loaded once per worker.
+
+    Source files are re-checked at most every ``RELOAD_INTERVAL`` seconds and
+    an edit triggers an incremental rebuild; async callers use ``refresh()``
+    so the rebuild runs in a thread instead of on the event loop.
+    """
+
+    def __init__(self, compiler: BundleCompiler, reload_interval: float = RELOAD_INTERVAL):
+        self.compiler = compiler
+        self.reload_interval = reload_interval
+        self._artifacts: Optional[Dict[str, CompiledArtifact]] = None
+        self._source_mtime = 0.0
+        self._checked_at = 0.0
+
+    def _current_source_mtime(self) -> float:
+        source_dir = self.compiler.source_dir
+        if not source_dir.is_dir():
+            return 0.0
+        return max((p.stat().st_mtime for p in source_dir.glob("*.json")), default=0.0)
+
+    def load(self) -> Dict[str, CompiledArtifact]:
+        self._source_mtime = self._current_source_mtime()
+        self._checked_at = time.monotonic()
+        manifest = self.compiler.build()
+        build_dir = self.compiler.build_dir
+        artifacts = {}
+        for name, entry in manifest["artifacts"].items():
+            variants = {"identity": (build_dir / entry["file"]).read_bytes()}
+            for encoding, filename in entry["encodings"].items():
+                variants[encoding] = (build_dir / filename).read_bytes()
+            artifacts[name] = CompiledArtifact(entry["version"], entry["etag"], variants)
+        self._artifacts = artifacts
+        return artifacts
+
+    def stale(self) -> bool:
+        """True if nothing is loaded yet or the sources changed (checked at most every reload_interval)."""
+        if self._artifacts is None:
+            return True
+        if self.reload_interval and time.monotonic() - self._checked_at > self.reload_interval:
+            self._checked_at = time.monotonic()
+            return self._current_source_mtime() != self._source_mtime
+        return False
+
+    async def refresh(self) -> None:
+        if self.stale():
+            await asyncio.to_thread(self.load)
+
+    def _artifacts_fresh(self) -> Dict[str, CompiledArtifact]:
+        if self.stale():
+            return self.load()
+        return self._artifacts
+
+    def get(self, name: str) -> Optional[CompiledArtifact]:
+        return self._artifacts_fresh().get(name)
+
+    def versions(self) -> Dict[str, str]:
+        return {name: a.version for name, a in self._artifacts_fresh().items()}
+
+
+def negotiate_encoding(accept_encoding: str, available: Dict[str, bytes]) -> str:
+    accepted = {
+        part.split(";")[0].strip().lower()
+        for part in (accept_encoding or "").split(",")
+        if part.strip() and not part.strip().endswith("q=0")
+    }
+    for encoding in ENCODINGS:
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+# Global bundle store instance
+bundle_store = BundleStore(BundleCompiler())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    result = BundleCompiler().build(prune=True)
+    for artifact_name, artifact in sorted(result["artifacts"].items()):
+        print(f"{artifact_name}: {artifact['version']} ({', '.join(['identity', *artifact['encodings']])})")
@@ -2,10 +2,14 @@
 Translation API endpoints for SmartLiva Clinical AI System
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
 from pydantic import BaseModel
 from typing import Dict, Optional
 from .translator import translator
+from .translation_bundles import bundle_store, etag_matches, negotiate_encoding
+from .language_detect import detect_language
+from .jobs import IdempotencyConflict, job_queue
+from .job_routes import accepted
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,10 +43,14 @@ async def translate_text(request: TranslationRequest):
             source_language=request.source_language
         )
         
+        source_language = request.source_language
+        if source_language == "auto":
+            source_language = detect_language(request.text) or "auto"
+        
         return TranslationResponse(
             original_text=request.text,
             translated_text=translated,
-            source_language=request.source_language,
+            source_language=source_language,
             target_language=request.target_language
         )
     except Exception as e:
@@ -69,26 +77,100 @@ async def translate_interface(request: InterfaceTranslationRequest):
         logger.error(f"Interface translation error: {e}")
         raise HTTPException(status_code=500, detail="Interface translation failed")
 
+async def run_interface_translation_job(payload: Dict, progress) -> Dict:
+    """Job handler: translate interface data one top-level section at a time"""
+    interface_data = payload["interface_data"]
+    target_language = payload["target_language"]
+    translated_data = {}
+    total = max(1, len(interface_data))
+    for done, (key, value) in enumerate(interface_data.items(), start=1):
+        section = await translator.translate_interface({key: value}, target_language)
+        translated_data.update(section)
+        progress(done / total, f"Translated {done}/{total} sections")
+    return {
+        "success": True,
+        "translated_data": translated_data,
+        "target_language": target_language
+    }
+
+job_queue.register("translate-interface", run_interface_translation_job)
+
+@router.post("/translate-interface/jobs", status_code=202)
+async def submit_interface_translation_job(
+    request: InterfaceTranslationRequest,
+    idempotency_key: Optional[str] = Header(None),
+):
+    """
+    Queue an interface translation; poll /api/jobs/{job_id} or stream /api/jobs/{job_id}/events
+    """
+    try:
+        job = job_queue.submit(
+            "translate-interface",
+            {"interface_data": request.interface_data, "target_language": request.target_language},
+            idempotency_key=idempotency_key,
+        )
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return accepted(job)
+
+async def serve_compiled(name: str, request: Request) -> Response:
+    """Serve a precompiled artifact with ETag revalidation and pre-compressed bodies"""
+    await bundle_store.refresh()
+    artifact = bundle_store.get(name)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Language not supported")
+
+    # A URL pinned to the current version (?v=...) never changes and may be cached for good
+    if request.query_params.get("v") == artifact.version:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=0, must-revalidate"
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), artifact.variants)
+    headers = {"ETag": artifact.etag_for(encoding), "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(
+        content=artifact.variants[encoding],
+        media_type="application/json; charset=utf-8",
+        headers=headers,
+    )
+
 @router.get("/languages")
-async def get_supported_languages():
+async def get_supported_languages(request: Request):
     """
     Get list of supported languages
     """
-    return {
-        "success": True,
-        "languages": translator.get_language_options()
-    }
+    return await serve_compiled("languages", request)
 
 @router.get("/medical-terms/{language}")
-async def get_medical_terms(language: str):
+async def get_medical_terms(language: str, request: Request):
     """
     Get medical terminology for specific language
     """
-    if language not in translator.medical_terms:
-        raise HTTPException(status_code=404, detail="Language not supported")
-    
+    return await serve_compiled(f"medical-terms/{language}", request)
+
+@router.get("/bundles")
+async def get_bundle_versions():
+    """
+    Get current bundle versions, for building cache-pinned bundle URLs
+    """
+    await bundle_store.refresh()
     return {
         "success": True,
-        "language": language,
-        "medical_terms": translator.medical_terms[language]
+        "bundles": {
+            name.split("/", 1)[1]: version
+            for name, version in bundle_store.versions().items()
+            if name.startswith("bundle/")
+        }
     }
+
+@router.get("/bundles/{language}")
+async def get_bundle(language: str, request: Request):
+    """
+    Get the precompiled interface bundle (UI strings + medical terms) for a language
+    """
+    return await serve_compiled(f"bundle/{language}", request)
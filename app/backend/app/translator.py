@@ -5,40 +5,34 @@ Supports Thai-English translation using OpenAI API
 
 import os
 import json
+import asyncio
+import hashlib
 from typing import Dict, List, Optional
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from googletrans import Translator
 import logging
+from .terminology import LANGUAGE_OPTIONS, MEDICAL_TERMS, SUPPORTED_LANGUAGES
+from .language_detect import detect_language, is_passthrough, split_foreign_spans
+from .segmenter import split_sentences
+from .shared_state import store
 
 logger = logging.getLogger(__name__)
 
+# Translated sentences are cached so re-translating an edited report only pays for changed sentences
+SEGMENT_CACHE_TTL = float(os.getenv("TRANSLATION_SEGMENT_CACHE_TTL", 30 * 24 * 3600))
+# Upper bound on concurrent upstream requests per worker while translating one or more reports
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", 4))
+
 class SmartLivaTranslator:
     def __init__(self):
         self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.async_openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self._upstream_limit = asyncio.Semaphore(TRANSLATION_CONCURRENCY)
         self.google_translator = Translator()
-        self.supported_languages = ["th", "en"]
+        self.supported_languages = SUPPORTED_LANGUAGES
         
         # Medical terminology mapping for accuracy
-        self.medical_terms = {
-            "en": {
-                "fibrosis": "fibrosis",
-                "cirrhosis": "cirrhosis", 
-                "hepatocellular carcinoma": "hepatocellular carcinoma",
-                "liver stiffness": "liver stiffness",
-                "ultrasound": "ultrasound",
-                "elastography": "elastography",
-                "kPa": "kPa"
-            },
-            "th": {
-                "fibrosis": "เส้นใยแข็งตับ",
-                "cirrhosis": "ตับแข็ง",
-                "hepatocellular carcinoma": "มะเร็งเซลล์ตับ", 
-                "liver stiffness": "ความแข็งของตับ",
-                "ultrasound": "อัลตราซาวด์",
-                "elastography": "อีลาสโตกราฟี",
-                "kPa": "กิโลปาสกาล"
-            }
-        }
+        self.medical_terms = MEDICAL_TERMS
     
     async def translate_medical_text(self, text: str, target_language: str, context: str = "medical") -> str:
         """
@@ -164,6 +158,65 @@ class SmartLivaTranslator:
         return text
 
     async def translate_text(self, text: str, target_language: str, source_language: str = "auto") -> str:
+        """
+        Translate text sentence by sentence; sentences are translated in parallel,
+        cached individually, and reassembled in their original order and spacing
+        """
+        if target_language not in self.supported_languages:
+            return await self._translate_upstream(text, target_language, source_language)
+        
+        segments = split_sentences(text)
+        if sum(1 for sentence, _ in segments if sentence) <= 1:
+            return await self._translate_segment(text, target_language, source_language)
+        
+        store.incr("translation.segmented")
+        translated = await asyncio.gather(*(
+            self._translate_segment(sentence, target_language, source_language)
+            for sentence, _ in segments
+        ))
+        return "".join(t + separator for t, (_, separator) in zip(translated, segments))
+
+    async def _translate_segment(self, text: str, target_language: str, source_language: str) -> str:
+        """
+        Translate one sentence, sending upstream only the spans not already in the target language
+        """
+        spans = split_foreign_spans(text, target_language)
+        foreign = [span for span, needs in spans if needs]
+        if not foreign:
+            # Already in the target language, or only numbers/units/stages
+            store.incr("translation.skipped")
+            return text
+        if len(foreign) == 1 and all(needs or is_passthrough(span) for span, needs in spans):
+            # Nothing to preserve but numbers/units around it; translate the sentence whole
+            return await self._translate_cached(text, target_language, source_language)
+        
+        store.incr("translation.partial")
+        parts = []
+        for span, needs in spans:
+            if needs:
+                core = span.strip()
+                lead = span[:len(span) - len(span.lstrip())]
+                trail = span[len(span.rstrip()):]
+                span_source = source_language if source_language != "auto" else (detect_language(core) or "auto")
+                parts.append(lead + await self._translate_cached(core, target_language, span_source) + trail)
+            else:
+                parts.append(span)
+        return "".join(parts)
+
+    async def _translate_cached(self, text: str, target_language: str, source_language: str) -> str:
+        """Upstream translation through the shared per-sentence cache"""
+        key = hashlib.sha256(f"{target_language}|{source_language}|{text}".encode("utf-8")).hexdigest()
+        cached = store.cache_get("translation", key)
+        if cached is not None:
+            return cached
+        async with self._upstream_limit:
+            translated = await self._translate_upstream(text, target_language, source_language)
+        # An unchanged result means every backend failed; don't pin that in the cache
+        if translated != text:
+            store.cache_set("translation", key, translated, SEGMENT_CACHE_TTL)
+        return translated
+
+    async def _translate_upstream(self, text: str, target_language: str, source_language: str = "auto") -> str:
         """
         Translate text using OpenAI API with medical context
         """
@@ -171,15 +224,16 @@ class SmartLivaTranslator:
             if target_language not in self.supported_languages:
                 raise ValueError(f"Unsupported target language: {target_language}")
             
-            # Use medical terminology first
-            translated_text = self._apply_medical_terms(text, target_language)
-            if translated_text != text:
-                return translated_text
+            # A segment that is exactly one glossary term is answered from the dictionary;
+            # substituting terms inside a sentence would return it half translated
+            glossary_term = self._glossary_term(text, target_language)
+            if glossary_term is not None:
+                return glossary_term
             
             # Use OpenAI for complex medical translations
             prompt = self._create_medical_translation_prompt(text, target_language, source_language)
             
-            response = await self.openai_client.chat.completions.acreate(
+            response = await self.async_openai_client.chat.completions.create(
                 model="gpt-4",
                 messages=[
                     {
@@ -197,8 +251,8 @@ class SmartLivaTranslator:
             
         except Exception as e:
             logger.error(f"OpenAI translation error: {e}")
-            # Fallback to Google Translate
-            return self._google_translate_fallback(text, target_language)
+            # Fallback to Google Translate (blocking client, so keep it off the event loop)
+            return await asyncio.to_thread(self._google_translate_fallback, text, target_language)
 
     def _create_medical_translation_prompt(self, text: str, target_lang: str, source_lang: str) -> str:
         """Create a specialized prompt for medical translation"""
@@ -219,18 +273,13 @@ class SmartLivaTranslator:
         - Return only the translation, no explanations
         """
 
-    def _apply_medical_terms(self, text: str, target_language: str) -> str:
-        """Apply medical terminology dictionary"""
-        if target_language not in self.medical_terms:
-            return text
-            
-        terms_dict = self.medical_terms[target_language]
-        translated_text = text
-        
-        for original, translation in terms_dict.items():
-            translated_text = translated_text.replace(original, translation)
-            
-        return translated_text
+    def _glossary_term(self, text: str, target_language: str) -> Optional[str]:
+        """Dictionary translation when the whole text is one medical term, else None"""
+        wanted = text.strip().casefold()
+        for original, translation in self.medical_terms.get(target_language, {}).items():
+            if original.casefold() == wanted:
+                return text.replace(text.strip(), translation)
+        return None
 
     def _google_translate_fallback(self, text: str, target_language: str) -> str:
         """Fallback to Google Translate"""
@@ -268,10 +317,7 @@ class SmartLivaTranslator:
 
     def get_language_options(self) -> List[Dict]:
         """Get available language options"""
-        return [
-            {"code": "th", "name": "ไทย", "flag": "🇹🇭"},
-            {"code": "en", "name": "English", "flag": "🇺🇸"}
-        ]
+        return LANGUAGE_OPTIONS
 
 # Global translator instance
 translator = SmartLivaTranslator()
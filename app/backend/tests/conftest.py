@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Keep tests off the shared state file used by running servers
+os.environ.setdefault("SMARTLIVA_STATE_PATH", os.path.join(tempfile.mkdtemp(), "state.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
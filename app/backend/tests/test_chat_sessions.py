@@ -0,0 +1,62 @@
+"""
+Regression tests: a session resumed on a worker must reflect turns saved by other workers
+"""
+
+from app.chat_sessions import ChatSessionStore
+
+
+def test_resume_prefers_newer_stored_copy(tmp_path):
+    db = str(tmp_path / "sessions.db")
+    worker_a = ChatSessionStore(db_path=db)
+    worker_b = ChatSessionStore(db_path=db)
+
+    session = worker_a.get_or_create("s1", "system")
+    session.append("user", "what is F2 fibrosis")
+    session.append("assistant", "moderate fibrosis")
+    worker_a.save(session)
+
+    # The client reconnects to worker B and continues there
+    moved = worker_b.get_or_create("s1", "system")
+    assert len(moved.history) == 2
+    moved.append("user", "and F3")
+    moved.append("assistant", "advanced fibrosis")
+    moved.last_used = session.last_used + 1
+    worker_b.save(moved)
+
+    # ...then back to worker A, which still caches the two-turn copy
+    resumed = worker_a.get_or_create("s1", "system")
+    assert [m["content"] for m in resumed.history] == [
+        "what is F2 fibrosis", "moderate fibrosis", "and F3", "advanced fibrosis",
+    ]
+
+
+def test_cached_copy_used_without_database():
+    store = ChatSessionStore(db_path=None)
+    session = store.get_or_create("s1", "system")
+    session.append("user", "hello")
+    assert store.get_or_create("s1", "system") is session
+
+
+def test_resume_uses_the_new_system_prompt(tmp_path):
+    store = ChatSessionStore(db_path=str(tmp_path / "sessions.db"))
+    session = store.get_or_create("s1", "answer in English")
+    session.append("user", "what is F2 fibrosis")
+    session.append("assistant", "moderate fibrosis")
+    store.save(session)
+
+    assert store.get_or_create("s1", "answer in Thai").messages[0]["content"] == "answer in Thai"
+    assert ChatSessionStore(db_path=str(tmp_path / "sessions.db")).get_or_create(
+        "s1", "answer in Thai"
+    ).messages[0]["content"] == "answer in Thai"
+
+
+def test_idle_stored_sessions_are_purged(tmp_path):
+    store = ChatSessionStore(idle_ttl=60, db_path=str(tmp_path / "sessions.db"))
+    stale = store.get_or_create("stale", "system")
+    stale.last_used -= 120
+    store.save(stale)
+    store.save(store.get_or_create("fresh", "system"))
+
+    assert store.purge_expired() == 1
+    ids = [row[0] for row in store._conn().execute("SELECT id FROM chat_sessions")]
+    assert ids == ["fresh"]
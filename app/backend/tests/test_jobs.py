@@ -0,0 +1,60 @@
+"""
+Regression tests: job idempotency and worker resilience
+"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.jobs import IdempotencyConflict, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.db", tmp_path / "files")
+
+
+def test_reused_key_with_different_payload_conflicts(queue):
+    async def handler(payload, progress):
+        return payload
+
+    queue.register("echo", handler)
+    first = queue.submit("echo", {"x": 1}, idempotency_key="k")
+    assert queue.submit("echo", {"x": 1}, idempotency_key="k")["job_id"] == first["job_id"]
+    with pytest.raises(IdempotencyConflict):
+        queue.submit("echo", {"x": 2}, idempotency_key="k")
+
+
+def test_worker_survives_a_failed_finish(queue, monkeypatch):
+    async def handler(payload, progress):
+        return payload
+
+    queue.register("echo", handler)
+    finish = queue._finish
+    failures = []
+
+    def flaky_finish(job_id, *args, **kwargs):
+        if not failures or failures[0] == job_id:
+            # Fails both the success and the failure record of the first job
+            failures.append(job_id)
+            raise sqlite3.OperationalError("database is locked")
+        return finish(job_id, *args, **kwargs)
+
+    monkeypatch.setattr(queue, "_finish", flaky_finish)
+
+    async def run():
+        queue.submit("echo", {"n": 1})
+        second = queue.submit("echo", {"n": 2})
+        queue.start(workers=1)
+        try:
+            for _ in range(100):
+                if queue.get(second["job_id"])["status"] == "succeeded":
+                    return True
+                await asyncio.sleep(0.05)
+            return False
+        finally:
+            await queue.stop()
+
+    assert asyncio.run(run())
+    assert failures
@@ -0,0 +1,28 @@
+"""
+Regression tests: all-caps report text is translated, clinical acronyms are not
+"""
+
+import pytest
+
+from app.language_detect import is_passthrough, split_foreign_spans
+
+
+@pytest.mark.parametrize("text", [
+    "LIVER: NORMAL SIZE, NO FOCAL LESION",
+    "IMPRESSION: MILD FATTY LIVER. NO MASS.",
+])
+def test_uppercase_report_is_sent_whole(text):
+    foreign = [span for span, needs in split_foreign_spans(text, "th") if needs]
+    assert foreign and foreign[0].startswith(text.split()[0])
+    assert "NO" in "".join(foreign)
+
+
+@pytest.mark.parametrize("text", ["F3 (ALT 45 U/L)", "8.7 kPa", "CT, MRI", "LI-RADS LR-5", "FIB-4 3.2"])
+def test_acronyms_and_codes_pass_through(text):
+    assert is_passthrough(text)
+
+
+def test_acronyms_inside_thai_stay_untranslated():
+    assert split_foreign_spans("ตับแข็ง F3 ค่า ALT 45 U/L ตรวจ CT", "th") == [
+        ("ตับแข็ง F3 ค่า ALT 45 U/L ตรวจ CT", False)
+    ]
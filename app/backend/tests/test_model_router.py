@@ -0,0 +1,51 @@
+"""
+Complexity scores and tier thresholds of the chat model router
+"""
+
+from app import model_router
+from app.model_router import route_chat, score_request
+
+
+def _user(content):
+    return [{"role": "user", "content": content}]
+
+
+def test_short_factual_question_scores_low():
+    reasons = score_request(_user("what is F2 fibrosis"))
+    assert reasons["cues"] == 0.0
+    assert reasons["depth"] == 0.0
+    assert sum(reasons.values()) < model_router.CHAT_ROUTER_THRESHOLD
+
+
+def test_differential_question_scores_high():
+    question = ("Compare the management of a cirrhosis patient with ascites, varices and "
+                "encephalopathy when ALT, AST and bilirubin are all rising after a biopsy")
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}] * 3
+    reasons = score_request(history + _user(question))
+    assert reasons["cues"] == 1.5
+    assert reasons["entities"] > 0
+    assert route_chat(history + _user(question), 1500).tier == "strong"
+
+
+def test_short_acronyms_match_whole_words_only():
+    assert model_router.count_entities("that is a fact") == 0
+    assert model_router.count_entities("CT showed F3") == 2
+
+
+def test_threshold_boundary(monkeypatch):
+    score = sum(score_request(_user("what is F2 fibrosis")).values())
+    monkeypatch.setattr(model_router, "CHAT_ROUTER_THRESHOLD", score)
+    assert route_chat(_user("what is F2 fibrosis"), 300).tier == "strong"
+    monkeypatch.setattr(model_router, "CHAT_ROUTER_THRESHOLD", score + 0.01)
+    assert route_chat(_user("what is F2 fibrosis"), 300).tier == "fast"
+
+
+def test_fast_cap_only_with_separate_fast_model(monkeypatch):
+    monkeypatch.setattr(model_router, "CHAT_MODEL_FAST", "same-model")
+    monkeypatch.setattr(model_router, "CHAT_MODEL_STRONG", "same-model")
+    assert route_chat(_user("what is F2 fibrosis"), 1500).max_tokens == 1500
+
+    monkeypatch.setattr(model_router, "CHAT_MODEL_FAST", "small-model")
+    route = route_chat(_user("what is F2 fibrosis"), 1500)
+    assert (route.tier, route.model) == ("fast", "small-model")
+    assert route.max_tokens == model_router.CHAT_FAST_MAX_TOKENS
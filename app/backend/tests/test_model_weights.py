@@ -0,0 +1,33 @@
+"""
+Regression tests: mapped weights are zero-copy views of the safetensors file
+"""
+
+import json
+import struct
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.model_weights import map_arrays
+
+
+def test_map_arrays_reads_safetensors_without_copying(tmp_path):
+    weight = np.arange(12, dtype=np.float32).reshape(3, 4)
+    bias = np.array([1, 2], dtype=np.int64)
+    header = {
+        "__metadata__": {"aliases": "{}"},
+        "fc.weight": {"dtype": "F32", "shape": [3, 4], "data_offsets": [0, 48]},
+        "fc.bias": {"dtype": "I64", "shape": [2], "data_offsets": [48, 64]},
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 8)
+    path = tmp_path / "model.safetensors"
+    path.write_bytes(struct.pack("<Q", len(header_bytes)) + header_bytes + weight.tobytes() + bias.tobytes())
+
+    arrays, metadata = map_arrays(path)
+    assert metadata == {"aliases": "{}"}
+    np.testing.assert_array_equal(arrays["fc.weight"], weight)
+    np.testing.assert_array_equal(arrays["fc.bias"], bias)
+    # Views into the mapping, not private copies
+    assert not arrays["fc.weight"].flags.owndata
@@ -0,0 +1,49 @@
+"""
+Regression tests: history paging must not skip rows and retried jobs must not double-count
+"""
+
+from unittest import mock
+
+import pytest
+
+from app.prediction_history import PredictionHistory
+
+PREDICTION = {
+    "te_kpa": 9.1, "fibrosis_stage": "F2", "classification_label": "Normal", "classification_confidence": 0.9,
+}
+
+
+def test_pages_rows_sharing_a_timestamp(tmp_path):
+    history = PredictionHistory(tmp_path / "predictions.db")
+    with mock.patch("app.prediction_history.time.time", return_value=1000.0):
+        for _ in range(5):
+            history.record(PREDICTION, patient_id="p1")
+    history.flush()
+
+    seen, before = [], None
+    while True:
+        page = history.history(patient_id="p1", before=before, limit=2)
+        seen.extend(item["id"] for item in page)
+        if len(page) < 2:
+            break
+        before = (page[-1]["created_at"], page[-1]["id"])
+    assert len(seen) == len(set(seen)) == 5
+
+
+def test_requeued_job_is_recorded_once(tmp_path):
+    history = PredictionHistory(tmp_path / "predictions.db")
+    for _attempt in range(2):
+        for index in range(3):
+            history.record(PREDICTION, patient_id="p1", inference_ms=10.0, record_id=f"job1-{index}")
+        history.flush()
+
+    summary = history.summary()
+    assert summary["total"] == 3
+    assert summary["fibrosis_stages"] == {"F2": 3}
+    assert summary["daily"][0]["count"] == 3
+    assert len(history.history(patient_id="p1")) == 3
+
+
+def test_history_requires_a_filter(tmp_path):
+    with pytest.raises(ValueError):
+        PredictionHistory(tmp_path / "predictions.db").history()
@@ -0,0 +1,33 @@
+"""
+Regression tests: sentence splitting must stay linear in the report length
+"""
+
+import time
+
+from app.segmenter import split_sentences
+
+REPORT = (
+    "Liver stiffness is 9.1 kPa. Dr. Smith reviewed the scan, e.g. the left lobe. "
+    "ผู้ป่วยมีไขมันพอกตับ และตับแข็ง ผลตรวจปกติ\n"
+)
+
+
+def test_round_trip_and_boundaries():
+    segments = split_sentences(REPORT)
+    assert "".join(sentence + separator for sentence, separator in segments) == REPORT
+    assert [sentence for sentence, _ in segments] == [
+        "Liver stiffness is 9.1 kPa.",
+        "Dr. Smith reviewed the scan, e.g. the left lobe.",
+        "ผู้ป่วยมีไขมันพอกตับ และตับแข็ง",
+        "ผลตรวจปกติ",
+    ]
+
+
+def test_long_report_is_split_in_linear_time():
+    report = REPORT * 2000  # ~270k characters
+    start = time.perf_counter()
+    segments = split_sentences(report)
+    elapsed = time.perf_counter() - start
+    assert "".join(sentence + separator for sentence, separator in segments) == report
+    # Quadratic scanning took tens of seconds at this size
+    assert elapsed < 2.0
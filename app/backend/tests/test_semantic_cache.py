@@ -0,0 +1,86 @@
+"""
+Regression tests: the semantic cache must never answer a different clinical question
+"""
+
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.semantic_cache import SemanticChatCache, question_signature
+
+# (cached question, new question): similar wording, different answer
+DIFFERENT_QUESTIONS = [
+    ("ไวรัสตับอักเสบบีติดต่ออย่างไร", "ไวรัสตับอักเสบซีติดต่ออย่างไร"),
+    ("what is the treatment for hepatitis b", "what is the treatment for hepatitis b in children"),
+    ("is fatty liver dangerous", "is fatty liver not dangerous"),
+    ("ไขมันพอกตับอันตรายไหม", "ไขมันพอกตับไม่อันตราย"),
+    ("ตับอักเสบบีรักษาอย่างไร", "ตับอักเสบบีในเด็กรักษาอย่างไร"),
+    ("can i take paracetamol with hepatitis b", "can i take paracetamol with hepatitis b during pregnancy"),
+    ("what does f2 fibrosis mean", "what does f3 fibrosis mean"),
+]
+
+# Paraphrases that should still share one cached answer
+PARAPHRASES = [
+    ("is fatty liver dangerous", "how dangerous is fatty liver disease"),
+    ("ไขมันพอกตับอันตรายไหม", "ไขมันพอกตับอันตรายหรือไม่"),
+    ("ไวรัสตับอักเสบบีติดต่ออย่างไร", "ไวรัสตับอักเสบบีติดต่อได้อย่างไร"),
+]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticChatCache(str(tmp_path / "semantic.db"))
+
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT_QUESTIONS)
+def test_distinguishing_tokens_differ(cached, asked):
+    assert question_signature(cached) != question_signature(asked)
+
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT_QUESTIONS)
+def test_different_question_is_not_served(cache, cached, asked):
+    cache.add(cached, "cached answer", 10)
+    cache.sync()
+    assert cache.lookup(asked) is None
+
+
+@pytest.mark.parametrize("cached, asked", PARAPHRASES)
+def test_paraphrase_is_served(cache, cached, asked):
+    cache.add(cached, "cached answer", 10)
+    cache.sync()
+    assert cache.lookup(asked) == {"reply": "cached answer", "usage_tokens": 10}
+
+
+def test_matching_entry_behind_a_mismatched_neighbour_is_found(cache):
+    cache.add("what is the treatment for hepatitis b in children", "children answer", 10)
+    cache.add("what is the treatment for hepatitis b", "adult answer", 10)
+    cache.sync()
+    assert cache.lookup("what is the treatment for hepatitis b")["reply"] == "adult answer"
+    assert cache.lookup("what is the treatment for hepatitis b in children")["reply"] == "children answer"
+
+
+def test_expired_entries_are_purged_from_table_and_index(tmp_path):
+    cache = SemanticChatCache(str(tmp_path / "semantic.db"), ttl=0.05)
+    cache.add("is fatty liver dangerous", "old answer", 10)
+    cache.sync()
+    assert len(cache._indexes["en"]) == 1
+    time.sleep(0.1)
+    assert cache.lookup("is fatty liver dangerous") is None
+    cache.compact()
+    assert "en" not in cache._indexes
+    assert cache._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0
+
+
+def test_index_search_filters_by_tag_and_age():
+    from app.semantic_cache import VectorIndex
+
+    index = VectorIndex(4)
+    vec = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+    index.add(1, vec, tag=0, created_at=10.0)
+    index.add(2, vec, tag=1, created_at=10.0)
+    index.add(3, vec, tag=1, created_at=20.0)
+    assert [entry_id for entry_id, _ in index.search(vec, 8, tag=1, since=15.0)] == [3]
+    assert index.search(vec, 8, tag=2) == []
+    assert index.count_before(10.0) == 2
@@ -0,0 +1,16 @@
+"""
+Regression tests: the shared cache must stay bounded
+"""
+
+from app.shared_state import SharedStore
+
+
+def test_purge_trims_cache_to_max_entries(tmp_path):
+    store = SharedStore(tmp_path / "state.db")
+    for i in range(10):
+        store.cache_set("chat", f"k{i}", i, ttl=100 + i)
+    store.cache_set("chat", "expired", 0, ttl=-1)
+
+    assert store.purge_expired(max_entries=4) == 7
+    # The entries closest to expiry go first
+    assert [store.cache_get("chat", f"k{i}") for i in range(10)] == [None] * 6 + [6, 7, 8, 9]
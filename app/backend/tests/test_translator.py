@@ -0,0 +1,17 @@
+"""
+Regression tests: the glossary shortcut must never return a half-translated sentence
+"""
+
+import pytest
+
+pytest.importorskip("googletrans")
+
+from app.translator import translator
+
+
+def test_glossary_answers_a_bare_term():
+    assert translator._glossary_term(" Cirrhosis ", "th") == " ตับแข็ง "
+
+
+def test_glossary_skips_sentences_containing_a_term():
+    assert translator._glossary_term("Moderate fibrosis is present.", "th") is None
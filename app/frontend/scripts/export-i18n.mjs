@@ -0,0 +1,49 @@
+/**
+ * Export the UI strings in src/i18n.ts to the backend bundle sources
+ * (app/backend/i18n/<lang>.json), compiled by `python -m app.translation_bundles`.
+ *
+ *   npm run export-i18n               write the JSON files
+ *   npm run export-i18n -- --check    exit 1 if they differ from i18n.ts (runs before build)
+ */
+import fs from "node:fs";
+import path from "node:path";
+import { createRequire } from "node:module";
+import { fileURLToPath } from "node:url";
+import ts from "typescript";
+
+const here = path.dirname(fileURLToPath(import.meta.url));
+const source = path.join(here, "..", "src", "i18n.ts");
+const outDir = path.join(here, "..", "..", "backend", "i18n");
+const check = process.argv.includes("--check");
+
+if (!fs.existsSync(outDir)) {
+  // Frontend-only checkouts (e.g. a Vercel build rooted at app/frontend) have nothing to sync
+  console.log(`export-i18n: ${outDir} not found, skipping`);
+  process.exit(0);
+}
+
+const { outputText } = ts.transpileModule(fs.readFileSync(source, "utf8"), {
+  compilerOptions: { module: ts.ModuleKind.CommonJS, target: ts.ScriptTarget.ES2019 },
+});
+const mod = { exports: {} };
+new Function("module", "exports", "require", outputText)(mod, mod.exports, createRequire(source));
+const { translations } = mod.exports;
+
+const stale = [];
+for (const [lang, strings] of Object.entries(translations)) {
+  const file = path.join(outDir, `${lang}.json`);
+  const content = JSON.stringify(strings, null, 2) + "\n";
+  const current = fs.existsSync(file) ? fs.readFileSync(file, "utf8") : null;
+  if (current === content) continue;
+  if (check) {
+    stale.push(path.relative(process.cwd(), file));
+  } else {
+    fs.writeFileSync(file, content);
+    console.log(`export-i18n: wrote ${path.relative(process.cwd(), file)}`);
+  }
+}
+
+if (stale.length) {
+  console.error(`export-i18n: out of date with src/i18n.ts: ${stale.join(", ")} (run npm run export-i18n)`);
+  process.exit(1);
+}